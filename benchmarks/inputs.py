@@ -0,0 +1,106 @@
+"""
+The sources the benchmarks run on: synthetic code of growing size and shape,
+and a corpus of stdlib modules.
+
+Synthetic sources are deterministic, so that results are comparable between
+runs and versions.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+
+# A block of typical code, repeated to reach a number of lines
+_BLOCK = '''\
+def function_{n}(a, b=None, *args, key=False, **kwargs):
+    """Docstring {n}"""
+    total = 0
+    for i, value in enumerate(args):
+        if value is None or i % 3 == 0:
+            continue
+        total += value * a - (b or 1)
+    try:
+        result = {{"total": total, "items": [x ** 2 for x in args if x]}}
+    except (TypeError, ValueError) as e:
+        raise RuntimeError(f"failed {{e!r}}") from e
+    return result
+
+
+class Class_{n}:
+    attribute: int = {n}
+
+    def method(self, other):
+        return lambda x: self.attribute + other + x
+
+
+'''
+
+STDLIB_MODULES = (
+    "typing",
+    "argparse",
+    "ast",
+    "dataclasses",
+    "inspect",
+    "subprocess",
+    "tokenize",
+    "collections",
+)
+
+
+def flat(lines: int) -> str:
+    """Typical top-level functions and classes, about lines long"""
+    block_lines = _BLOCK.count("\n")
+    return "".join(_BLOCK.format(n=n) for n in range(max(lines // block_lines, 1)))
+
+
+def nested_blocks(depth: int) -> str:
+    """Statements nested depth levels deep"""
+    lines = []
+    for level in range(depth):
+        lines.append("    " * level + f"if x{level}:")
+    lines.append("    " * depth + "pass")
+    return "\n".join(lines) + "\n"
+
+
+def nested_expression(depth: int) -> str:
+    """A single expression with depth levels of parentheses and operators"""
+    return "x = " + "(1 + " * depth + "1" + ")" * depth + "\n"
+
+
+def huge_list(items: int) -> str:
+    """A list literal of ints, on a single line"""
+    return "x = [" + ", ".join(str(i) for i in range(items)) + "]\n"
+
+
+def huge_string(size: int) -> str:
+    """A string literal of size characters"""
+    return f"x = {'a' * size!r}\n"
+
+
+def huge_dict(items: int) -> str:
+    """A dict literal, one item per line"""
+    body = "".join(f"    'key_{i}': {i},\n" for i in range(items))
+    return "x = {\n" + body + "}\n"
+
+
+def stdlib(name: str) -> str:
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin is None:
+        raise ValueError(f"module {name} has no source")
+    return Path(spec.origin).read_text()
+
+
+def sources(quick: bool = False) -> dict[str, str]:
+    """Every benchmark input, by name. quick skips the largest ones"""
+    sizes = (1_000, 10_000) if quick else (1_000, 10_000, 100_000)
+    result = {f"flat-{size // 1000}k": flat(size) for size in sizes}
+    # The parser and the compiler limit nesting to about 100 levels
+    result["nested-blocks-90"] = nested_blocks(90)
+    result["nested-expr-180"] = nested_expression(180)
+    result["huge-list-100k"] = huge_list(100_000)
+    result["huge-string-1m"] = huge_string(1_000_000)
+    result["huge-dict-10k"] = huge_dict(10_000)
+    for name in STDLIB_MODULES:
+        result[f"stdlib-{name}"] = stdlib(name)
+    return result
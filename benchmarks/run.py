@@ -0,0 +1,364 @@
+"""
+Benchmarks of the pipeline and rendering hot paths.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --quick --compare results.json
+
+Each benchmark runs on every input of inputs.sources(), up to --repeat times or
+until it took --max-time seconds, and reports the median and minimum time.
+The pilot benchmarks run the app headless, and measure the time until the
+panels are first filled in, and the latency of hovering over the source.
+
+Results are written as JSON, with the interpreter and commit they were run
+with, and can be compared with an earlier run with --compare.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import ast
+import dis
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from inputs import sources  # noqa: E402
+
+from ast_widget import ASTWidget  # noqa: E402
+from detail_store import DetailStore  # noqa: E402
+from details import (  # noqa: E402
+    _disassemble,
+    _get_instructions,
+    ast_details,
+    bytecode_details,
+    dump_iter,
+)
+from diff import diff_details, instruction_key  # noqa: E402
+from pipeline import VERSION_3_13, Pipeline  # noqa: E402
+from search_index import Query, SearchIndex  # noqa: E402
+from token_widget import TokenWidget  # noqa: E402
+
+if VERSION_3_13:
+    from details import PseudoInstrsArgResolver  # noqa: E402
+
+# Makes a function to time from the source of an input
+Benchmark = Callable[[str], Callable[[], object]]
+
+# The number of lines highlighted by the highlight benchmark
+HIGHLIGHTS = 1000
+# The number of hovers of the hover latency benchmark
+HOVERS = 50
+# The size of the terminal for the pilot benchmarks
+PILOT_SIZE = (200, 60)
+
+
+def bench_dump_iter(code: str) -> Callable[[], object]:
+    tree = ast.parse(code)
+    return lambda: list(dump_iter(tree))
+
+
+def bench_token_set_code(code: str) -> Callable[[], object]:
+    widget = TokenWidget(id="tokens")
+
+    def run() -> None:
+        # Not memoized between runs
+        widget.pipeline = Pipeline()
+        widget.set_code(code)
+
+    return run
+
+
+def bench_get_instructions(code: str) -> Callable[[], object]:
+    pseudo = Pipeline().pseudo_bytecode(code)
+    jump_targets = [
+        target
+        for op, target, *_ in pseudo.instructions
+        if op in dis.hasjump or op in dis.hasexc
+    ]
+    labels_map = {offset: i for i, offset in enumerate(jump_targets, start=1)}
+    resolver = PseudoInstrsArgResolver(
+        co_consts=pseudo.co_consts, labels_map=labels_map
+    )
+    return lambda: list(_get_instructions(pseudo.instructions, resolver))
+
+
+def bench_disassemble_pseudo(code: str) -> Callable[[], object]:
+    pseudo = Pipeline().pseudo_bytecode(code)
+    return lambda: _disassemble(pseudo.instructions, pseudo.co_consts, "pseudo")
+
+
+def bench_disassemble_compiled(code: str) -> Callable[[], object]:
+    co = compile(code, "<benchmark>", "exec")
+    instructions = list(dis.Bytecode(co))
+    return lambda: _disassemble(instructions, co.co_consts, "compiled")
+
+
+def bench_detail_store(code: str) -> Callable[[], object]:
+    details = ast_details(Pipeline(), code)
+    return lambda: DetailStore.from_details(details)
+
+
+def bench_update(code: str) -> Callable[[], object]:
+    store = DetailStore.from_details(ast_details(Pipeline(), code))
+    widget = ASTWidget(id="ast")
+    return lambda: widget.update(store)
+
+
+def bench_search_index(code: str) -> Callable[[], object]:
+    store = DetailStore.from_details(ast_details(Pipeline(), code))
+    return lambda: SearchIndex(store)
+
+
+def bench_search(code: str) -> Callable[[], object]:
+    index = SearchIndex(DetailStore.from_details(ast_details(Pipeline(), code)))
+    queries = [Query(text) for text in ("Name", "Call func", "Name Load x*")]
+    return lambda: [index.search(query) for query in queries]
+
+
+def bench_diff_ast(code: str) -> Callable[[], object]:
+    pipeline = Pipeline()
+    before = ast_details(pipeline, code)
+    after = ast_details(pipeline, code, optimized=True)
+    return lambda: diff_details(before, after)
+
+
+def bench_diff_bytecode(code: str) -> Callable[[], object]:
+    pipeline = Pipeline()
+    before = bytecode_details(pipeline, code, "pseudo")
+    after = bytecode_details(pipeline, code, "optimized")
+    return lambda: diff_details(before, after, instruction_key)
+
+
+def bench_highlight(code: str) -> Callable[[], object]:
+    widget = ASTWidget(id="ast")
+    widget.update(DetailStore.from_details(ast_details(Pipeline(), code)))
+    nlines = code.count("\n") + 1
+    lines = [1 + i * nlines // HIGHLIGHTS for i in range(HIGHLIGHTS)]
+
+    def run() -> None:
+        for line in lines:
+            widget.highlight(line)
+
+    return run
+
+
+BENCHMARKS: dict[str, Benchmark] = {
+    "dump_iter": bench_dump_iter,
+    "TokenWidget.set_code": bench_token_set_code,
+    "_disassemble[compiled]": bench_disassemble_compiled,
+    "DetailStore.from_details": bench_detail_store,
+    "BaseWidget.update": bench_update,
+    f"highlight[x{HIGHLIGHTS}]": bench_highlight,
+    "SearchIndex": bench_search_index,
+    "SearchIndex.search[x3]": bench_search,
+}
+if VERSION_3_13:
+    BENCHMARKS["_get_instructions"] = bench_get_instructions
+    BENCHMARKS["_disassemble[pseudo]"] = bench_disassemble_pseudo
+    BENCHMARKS["diff_details[ast]"] = bench_diff_ast
+    BENCHMARKS["diff_details[bytecode]"] = bench_diff_bytecode
+
+
+async def _first_paint(code: str) -> float:
+    from viewer import CodeViewer
+
+    started = time.perf_counter()
+    app = CodeViewer()
+    app.startup_code = code
+    async with app.run_test(size=PILOT_SIZE) as pilot:
+        # The panels are computed by workers started on mount
+        await pilot.pause()
+        await app.workers.wait_for_complete()
+        await pilot.pause()
+        return time.perf_counter() - started
+
+
+async def _hover_latencies(code: str) -> list[float]:
+    from viewer import CodeViewer
+
+    app = CodeViewer()
+    app.startup_code = code
+    latencies = []
+    async with app.run_test(size=PILOT_SIZE) as pilot:
+        # Hover highlights the tokens and AST panels too
+        await pilot.press("2", "3")
+        await pilot.pause(0.5)
+        height = app.query_one("#source").size.height
+        for i in range(HOVERS):
+            started = time.perf_counter()
+            await pilot.hover("#source", offset=(10, i % height))
+            await pilot.pause()
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def bench_first_paint(code: str) -> Callable[[], object]:
+    return lambda: asyncio.run(_first_paint(code))
+
+
+PILOT_INPUTS = ("flat-10k", "stdlib-typing")
+
+
+def time_runs(run: Callable[[], object], repeat: int, max_time: float) -> list[float]:
+    times: list[float] = []
+    total_started = time.perf_counter()
+    while len(times) < repeat:
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+        if time.perf_counter() - total_started > max_time:
+            break
+    return times
+
+
+def summarize(times: list[float], lines: int) -> dict[str, Any]:
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "runs": len(times),
+        "lines": lines,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(name: str, result: dict[str, Any]) -> None:
+    if "error" in result:
+        print(f"{name:55} {result['error']}", flush=True)
+    else:
+        print(
+            f"{name:55} {result['median'] * 1000:10.2f} ms"
+            f" (min {result['min'] * 1000:.2f}, {result['runs']} runs)",
+            flush=True,
+        )
+
+
+def run(args: argparse.Namespace) -> dict[str, dict[str, Any]]:
+    results: dict[str, dict[str, Any]] = {}
+    inputs = sources(quick=args.quick)
+
+    def selected(name: str) -> bool:
+        return args.filter is None or args.filter in name
+
+    for bench_name, benchmark in BENCHMARKS.items():
+        for input_name, code in inputs.items():
+            name = f"{bench_name}/{input_name}"
+            if not selected(name):
+                continue
+            lines = code.count("\n")
+            try:
+                times = time_runs(benchmark(code), args.repeat, args.max_time)
+            except (SyntaxError, RecursionError, MemoryError, ValueError) as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+            else:
+                results[name] = summarize(times, lines)
+            report(name, results[name])
+
+    if args.no_pilot:
+        return results
+    for input_name in PILOT_INPUTS:
+        code = inputs[input_name]
+        lines = code.count("\n")
+        name = f"pilot.first_paint/{input_name}"
+        if selected(name):
+            times = time_runs(bench_first_paint(code), args.repeat, args.max_time)
+            results[name] = summarize(times, lines)
+            report(name, results[name])
+        name = f"pilot.hover/{input_name}"
+        if selected(name):
+            results[name] = summarize(asyncio.run(_hover_latencies(code)), lines)
+            report(name, results[name])
+    return results
+
+
+def compare(old: dict[str, Any], new: dict[str, Any], threshold: float) -> None:
+    """Print the change of the median of each benchmark in both runs"""
+    print(f"\n{'benchmark':55} {'old ms':>10} {'new ms':>10} {'change':>8}")
+    for name, result in new["results"].items():
+        previous = old["results"].get(name)
+        if previous is None or "median" not in previous or "median" not in result:
+            continue
+        ratio = result["median"] / previous["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  slower"
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(
+            f"{name:55} {previous['median'] * 1000:10.2f} "
+            f"{result['median'] * 1000:10.2f} {ratio:7.2f}x{flag}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", metavar="PATH", help="write the results as JSON")
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare with the results of an earlier run"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="the relative change flagged by --compare (default: 0.1)",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="skip the largest synthetic inputs"
+    )
+    parser.add_argument(
+        "--no-pilot", action="store_true", help="skip the headless app benchmarks"
+    )
+    parser.add_argument(
+        "--filter", metavar="TEXT", help="only run benchmarks whose name contains TEXT"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="the maximum number of runs (default: 5)"
+    )
+    parser.add_argument(
+        "--max-time",
+        type=float,
+        default=5.0,
+        help="stop repeating a benchmark after this many seconds (default: 5)",
+    )
+    args = parser.parse_args()
+
+    # Deeply nested inputs need more than the default
+    sys.setrecursionlimit(10_000)
+    data = {
+        "python": sys.version,
+        "implementation": sys.implementation.name,
+        "platform": platform.platform(),
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": run(args),
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(data, indent=2) + "\n")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), data, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Check that starting the UI stays fast.
+
+    python benchmarks/startup.py --budget 400
+
+Imports what main.py imports before starting the UI in a fresh interpreter
+with -X importtime, a few times, and fails when the fastest run takes longer
+than the budget, or when a module that is only needed later (hidden panels,
+the editor, directory mode) was imported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+from typing import NamedTuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Written to stderr before importing, to leave out the interpreter's own imports
+MARKER = "-- codoscope --"
+
+STARTUP = f"""\
+import sys
+sys.path.insert(0, {str(ROOT / "src")!r})
+sys.stderr.write({MARKER!r} + "\\n")
+import main
+from viewer import CodeViewer
+"""
+
+# Imported on first use only
+DEFERRED = (
+    "ast_widget",
+    "token_widget",
+    "incremental",
+    "editor",
+    "textual.widgets._text_area",
+    "project",
+    "runtime",
+    "watcher",
+    "multiprocessing",
+    "unittest",
+)
+
+
+class Import(NamedTuple):
+    name: str
+    # In microseconds
+    self_time: int
+    cumulative: int
+
+
+def import_times(python: str) -> list[Import]:
+    """The imports of a cold start, from -X importtime"""
+    stderr = subprocess.run(
+        [python, "-X", "importtime", "-c", STARTUP],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    imports = []
+    for line in stderr.split(MARKER, 1)[1].splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        imports.append(Import(name.strip(), int(self_time), int(cumulative)))
+    return imports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=400.0,
+        metavar="MS",
+        help="the maximum import time of a cold start (default: 400)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="the number of runs (default: 5)"
+    )
+    parser.add_argument(
+        "--python",
+        default=sys.executable,
+        help="the interpreter to check (default: this one)",
+    )
+    args = parser.parse_args()
+
+    runs = [import_times(args.python) for _ in range(args.repeat)]
+    fastest = min(runs, key=lambda imports: sum(i.self_time for i in imports))
+    total = sum(i.self_time for i in fastest) / 1000
+    print(
+        f"{len(fastest)} modules imported in {total:.1f} ms (budget {args.budget} ms)"
+    )
+    print("slowest modules, by own import time:")
+    for i in sorted(fastest, key=lambda i: i.self_time, reverse=True)[:10]:
+        print(f"  {i.self_time / 1000:8.1f} ms  {i.name}")
+
+    ok = total <= args.budget
+    imported = {i.name for i in fastest}
+    for name in DEFERRED:
+        if name in imported:
+            print(f"{name} should only be imported on first use")
+            ok = False
+    if total > args.budget:
+        print(f"over budget by {total - args.budget:.1f} ms")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
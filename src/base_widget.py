@@ -1,81 +1,272 @@
-from collections import defaultdict
-from typing import Iterable, TypeAlias
+import time
+from typing import Hashable, Iterable
 
-from textual.app import ComposeResult
-from textual.containers import ScrollableContainer
-from textual import events
-from textual.geometry import Region
-from textual.widgets import Static
-from rich.syntax import Syntax
+from rich.text import Text
+from textual import events, work
 
-from events import HoverLine
-from styles import HIGHLIGHT
+from detail_store import DetailStore
+from details import Detail, Span, position_key, span_keys
+from diff import CHANGED_FROM, CHANGED_TO, INSERTED, REMOVED, diff_details
+from events import HoverLine, SearchMatches
+from interval_index import IntervalIndex
+from pipeline import Pipeline
+from profiling import profiler
+from row_view import RowView
+from search_index import Query, SearchIndex
+from styles import CHANGED_ROW, INSERTED_ROW, REMOVED_ROW
 
+# The style of the prefix of each kind of row of a diff
+_DIFF_STYLES = {
+    REMOVED: REMOVED_ROW,
+    INSERTED: INSERTED_ROW,
+    CHANGED_FROM: CHANGED_ROW,
+    CHANGED_TO: CHANGED_ROW,
+}
 
-Detail: TypeAlias = tuple[
-    str, int, int
-]  # data to show, start and end line. python-style range
 
-
-class BaseWidget(ScrollableContainer):
+class BaseWidget(RowView):
     """
     Display "details" about a piece a code. Each "detail" is shown as a line, and
     corresponds to a segment of lines in the source.
 
     For example a detail can be a token, an AST node, or a bytecode instruction.
+
+    Rows are highlighted and rendered lazily, as they are scrolled into view, so
+    the cost of showing a panel doesn't depend on the number of details.
+
+    The rows matching a search are marked, or, when filtering, the only ones
+    shown. The search index is built in a worker, on the first search after
+    the details change.
+
+    In diff mode, the panel shows the changes from the details of the previous
+    stage instead, aligned by the worker computing the details.
+
+    After a run of the code, the rows of the lines that ran are tinted by how
+    often they ran, through the same mapping to source lines as highlighting.
+
+    Rows standing for a span of source, down to the column, are also indexed by
+    position, so that hovering a position or a row links exactly the rows of
+    what is there rather than every row of its lines.
     """
 
-    # lineno_map maps source line numbers, to the indices of all details in that line
-    lineno_map: defaultdict[int, set[int]]
-    # detail_poistions[i] indicate the position of the i-th detail shown.
-    detail_positions: list[int]
+    # The details shown, by row
+    store: DetailStore
+    # The rows of the details matching the search
+    matches: list[int]
+    # The rows covering each source line
+    index: IntervalIndex
+    # The rows covering each source position, by key, for rows with a span
+    positions: IntervalIndex
+    # The compile pipeline shared with the other panels
+    pipeline: Pipeline
+    # The stage shown, names the panel's entries in the disk cache
+    stage: str
+    # Set when the code changed while the panel was hidden
+    dirty: bool = False
+    # Show the changes from base_details, rather than the details
+    diff: bool = False
+    # The seconds it took to get the details last shown, and to show them
+    compute_time: float | None = None
 
-    def __init__(self, id: str) -> None:
+    def __init__(self, id: str, pipeline: Pipeline | None = None) -> None:
         super().__init__(id=id)
-        self.lineno_map = defaultdict(set)
-        self.detail_positions = []
-
-    def compose(self) -> ComposeResult:
-        yield Static(classes="display", expand=True)
-
-    def update(self, details: Iterable[Detail]) -> None:
-        output_lines: list[str] = []
-        self.lineno_map.clear()
-        self.detail_positions = []
-        width = 0
-        for detail_idx, detail in enumerate(details, start=1):
-            formatted, start_line, end_line = detail
-            for lineno in range(start_line, end_line):
-                self.lineno_map[lineno].add(detail_idx)
-            self.detail_positions.append(start_line)
-            output_lines.append(formatted)
-            width = max(width, len(formatted))
-
-        static = self.query_one(".display", Static)
-        self._prerendered = Syntax(
-            "\n".join(output_lines),
-            "python",
-            word_wrap=False,
-        )
-        static.update(self._prerendered)
-        static.styles.width = width
+        self.pipeline = pipeline if pipeline is not None else Pipeline()
+        self.store = DetailStore()
+        self.index = IntervalIndex()
+        self.positions = IntervalIndex(typecode="q")
+        self.matches = []
+        # The line and span a HoverLine was last posted for
+        self._hover: tuple[int, Span | None] | None = None
+        # All the details, of which store only has the matches when filtering
+        self._all = self.store
+        self._query: Query | None = None
+        self._filter = False
+        self._search_index: SearchIndex | None = None
+        # The heat level of each source line that ran
+        self._line_heat: dict[int, int] = {}
+
+    def details(
+        self, code: str, spans: list[Span | None] | None = None
+    ) -> Iterable[Detail]:
+        """
+        Compute the details to show for code, appending the span of each to
+        spans if given and known.
+
+        This runs in a worker thread, so it must not touch the DOM.
+        """
+        raise NotImplementedError
+
+    def base_details(self, code: str) -> Iterable[Detail]:
+        """The details of the previous stage, which diff mode compares with"""
+        raise NotImplementedError
+
+    def diff_key(self, text: str) -> Hashable:
+        """What must be equal for the rows of both stages to be aligned"""
+        return text
+
+    def cached_details(self, code: str) -> DetailStore:
+        """The details for code, from the pipeline's disk cache if possible"""
+        started = time.perf_counter()
+        # Read once, diff mode may be toggled meanwhile
+        diff = self.diff
+        cache = self.pipeline.disk_cache
+        if cache is None:
+            details = self._details(code, diff)
+        else:
+            source_hash = self.pipeline.source_hash(code)
+            stage = f"{self.stage} diff" if diff else self.stage
+            if self.pipeline.incremental:
+                # Rows built incrementally have no spans, keep them apart
+                stage += " incremental"
+            cached = cache.get(source_hash, stage)
+            if cached is None:
+                details = self._details(code, diff)
+                cache.put(source_hash, stage, details)
+            else:
+                details = cached
+        self.compute_time = time.perf_counter() - started
+        return details
+
+    def _details(self, code: str, diff: bool) -> DetailStore:
+        # Excludes the stages computed meanwhile, see Profiler
+        with profiler.measure(f"{self.stage} format"):
+            if diff:
+                details = diff_details(
+                    list(self.base_details(code)),
+                    list(self.details(code)),
+                    self.diff_key,
+                )
+                return DetailStore.from_details(details)
+            spans: list[Span | None] = []
+            return DetailStore.from_details(self.details(code, spans), spans)
+
+    def set_code(self, code: str) -> None:
+        self.update(self.cached_details(code))
+
+    def show_message(self, message: str | Text) -> None:
+        self.store = self._all = DetailStore()
+        self.index = IntervalIndex()
+        self.positions = IntervalIndex(typecode="q")
+        self.matches = []
+        self._hover = None
+        super().show_message(message)
+
+    def update(self, store: DetailStore) -> None:
+        started = time.perf_counter()
+        with profiler.measure(f"{self.stage} update"):
+            self._update(store)
+        if self.compute_time is not None:
+            self.compute_time += time.perf_counter() - started
+
+    def _update(self, store: DetailStore) -> None:
+        self._all = store
+        self.matches = []
+        self._show(store)
+        if self._query:
+            self.search(store, self._query)
+
+    def _show(self, store: DetailStore) -> None:
+        self.store = store
+        self.index = IntervalIndex(store.starts, store.ends)
+        span_columns = store.span_columns
+        if span_columns is not None:
+            self.positions = IntervalIndex(*span_columns, typecode="q")
+        else:
+            self.positions = IntervalIndex(typecode="q")
+        self._hover = None
+        # The store is the sequence of the rows' texts
+        self.set_rows(store, store.width)
+        if self._line_heat:
+            self._show_heat()
+
+    def highlight_text(self, row: int) -> Text:
+        text = super().highlight_text(row)
+        if self.diff:
+            style = _DIFF_STYLES.get(text.plain[:2])
+            if style is not None:
+                text.stylize(style, 0, 1)
+        return text
+
+    def unfiltered_row(self, row: int) -> int:
+        """The row of all the details shown at row"""
+        return self.matches[row] if self.store is not self._all else row
+
+    def set_search(self, query: Query | None, filter: bool) -> None:
+        """Mark the rows matching query, or only show them if filter"""
+        self._query = query
+        self._filter = filter
+        if not self._all:
+            return  # Searched once there are details, see _update
+        if query:
+            self.search(self._all, query)
+        else:
+            self._show_matches(self._all, query, [])
+
+    @work(thread=True, group="search", exclusive=True)
+    def search(self, store: DetailStore, query: Query) -> None:
+        """Find the rows of store matching query, off the event loop"""
+        index = self._search_index
+        if index is None or index.store is not store:
+            index = self._search_index = SearchIndex(store)
+        matches = index.search(query)
+        self.app.call_from_thread(self._show_matches, store, query, matches)
+
+    def _show_matches(
+        self, store: DetailStore, query: Query | None, matches: list[int]
+    ) -> None:
+        # A cancelled search still runs to the end, it may finish after a
+        # newer one
+        if store is not self._all or query is not self._query:
+            return  # The details or the query changed meanwhile
+        self.matches = matches
+        if self._filter and self._query:
+            self._show(store.take(matches))
+        else:
+            if self.store is not store:
+                self._show(store)
+            self.mark_rows(set(matches))
+        self.post_message(SearchMatches(self, [store.start(row) for row in matches]))
+
+    def set_heat(self, line_heat: dict[int, int]) -> None:
+        """Tint the rows of each source line by its heat level"""
+        self._line_heat = line_heat
+        self._show_heat()
+
+    def _show_heat(self) -> None:
+        rows: dict[int, int] = {}
+        for line, level in self._line_heat.items():
+            for row in self.index.overlapping(line):
+                if rows.get(row, 0) < level:
+                    rows[row] = level
+        self.heat_rows(rows)
 
     def on_mouse_move(self, event: events.MouseMove) -> None:
-        if event.y < len(self.detail_positions):
-            line = self.detail_positions[event.y]
-            self.post_message(HoverLine(line))
-
-    def highlight(self, line: int) -> None:
-        body = self.query_one(".display", Static)
-        self._prerendered._stylized_ranges.clear()  # No public API for this?
-        for highlight_line in self.lineno_map[line]:
-            self._prerendered.stylize_range(
-                HIGHLIGHT, (highlight_line, 0), (highlight_line + 1, 0)
-            )
-        body.update(self._prerendered)
+        row = self.row_at(event.y)
+        if row < len(self.store):
+            hover = (self.store.start(row), self.store.span(row))
+            if hover != self._hover:
+                self._hover = hover
+                self.post_message(HoverLine(hover[0], span=hover[1]))
+
+    def highlight(
+        self, line: int, column: int | None = None, span: Span | None = None
+    ) -> None:
+        """
+        Highlight the rows of what is at a column of a source line: the
+        innermost rows covering that position. Or for a span, the rows within
+        it, or else the innermost rows covering its start. Rows without a span,
+        or no column or span, fall back to the rows covering the line.
+        """
+        rows: list[int] = []
+        if span is not None:
+            start, end = span_keys(span)
+            rows = self.positions.within(start, end) or self.positions.innermost(start)
+        elif column is not None:
+            rows = self.positions.innermost(position_key(line, column))
+        if not rows:
+            rows = self.index.overlapping(line)
+        self.highlight_rows(set(rows))
 
         # Ensure it's visible
-        if self.lineno_map[line]:
-            min_line = min(self.lineno_map[line]) - 1
-            max_line = max(self.lineno_map[line]) - 1
-            self.scroll_to_region(Region(0, min_line, 1, max_line - min_line + 1))
+        if rows:
+            self.scroll_to_rows(rows[0], rows[-1])
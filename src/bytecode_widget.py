@@ -1,133 +1,71 @@
 from __future__ import annotations
 
-import ast
-import dis
-from typing import Any, Iterable, Literal, Sequence, TypeAlias
-import sys
-
-from base_widget import BaseWidget, Detail
-
-# Conditional imports for 3.13
-VERSION_3_13 = sys.version_info >= (3, 13)
-
-if VERSION_3_13:
-    compiler_codegen: Any
-    optimize_cfg: Any
-    assemble_code_object: Any
-    from _testinternalcapi import compiler_codegen, optimize_cfg, assemble_code_object  # type: ignore
-else:
-
-    def _fail(*args: Any, **kwargs: Any) -> Any:
-        raise Exception("This function should never have been called")
-
-    compiler_codegen = optimize_cfg = assemble_code_object = _fail
-
-
-BytecodeMode: TypeAlias = Literal["pseudo", "optimized", "compiled"]
-
-PseudoInstruction: TypeAlias = tuple[
-    int, int | None, int, int, int, int
-]  # op, oparg, startline, endline, startcol, endcol
-
-
-if VERSION_3_13:
-
-    class PseudoInstrsArgResolver(dis.ArgResolver):
-        def offset_from_jump_arg(self, op: int, arg: int, offset: int) -> int:
-            if op in dis.hasjump or op in dis.hasexc:
-                return arg
-            return super().offset_from_jump_arg(op, arg, offset)
-
-    class AppendStream:
-        def __init__(self, append_to: list[Detail]) -> None:
-            self.target = append_to
-            self.target_line = 0
-
-        def write(self, line: str) -> None:
-            if line.strip():
-                self.target.append((line, self.target_line, self.target_line + 1))
-
-    class Formatter(dis.Formatter):
-        file: AppendStream
-
-        def print_instruction(
-            self, instr: dis.Instruction, mark_as_current: bool = False
-        ) -> None:
-            if instr.line_number:
-                self.file.target_line = instr.line_number
-            super().print_instruction(instr, mark_as_current=mark_as_current)
-
-
-def _get_instructions(
-    insts: Iterable[PseudoInstruction | dis.Instruction],
-    arg_resolver: PseudoInstrsArgResolver,
-) -> Iterable[dis.Instruction]:
-    prev_line = None
-    for offset, inst in enumerate(insts):
-        if isinstance(inst, dis.Instruction):
-            yield inst
-            continue
-        op, arg = inst[:2]
-        start_offset = 0
-        positions = dis.Positions(*inst[2:6])
-        line_number = positions.lineno if (positions.lineno or 0) > 0 else None
-        starts_line = line_number != prev_line
-        prev_line = line_number
-        label = arg_resolver.labels_map.get(offset, None)
-        argval, argrepr = arg_resolver.get_argval_argrepr(op, arg, offset)
-        yield dis.Instruction(
-            dis._all_opname[op],
-            op,
-            arg,
-            argval,
-            argrepr,
-            offset,
-            start_offset,
-            starts_line,
-            line_number,
-            label,
-            positions,
-        )
-
-
-def _disassemble(
-    insts: Sequence[PseudoInstruction | dis.Instruction],
-    co_consts: Sequence[object],
-    title: str,
-) -> Iterable[Detail]:
-    result: list[Detail] = []
-    if VERSION_3_13:
-        jump_targets = [
-            target for op, target, *_ in insts if op in dis.hasjump or op in dis.hasexc
-        ]
-        labels_map = {offset: i for i, offset in enumerate(jump_targets, start=1)}
-
-        label_width = 4 + len(str(len(labels_map)))
-        arg_resolver = PseudoInstrsArgResolver(
-            co_consts=co_consts, labels_map=labels_map
-        )
-
-        dis.print_instructions(
-            _get_instructions(insts, arg_resolver),
-            None,  # exception_entries
-            Formatter(
-                file=AppendStream(result), lineno_width=6, label_width=label_width
-            ),
-        )
-        return result
-    else:
-        line = 0
-        for i in insts:
-            assert isinstance(i, dis.Instruction)
-            if i.positions:
-                line = i.positions.lineno or line
-            result.append((i._disassemble(), line, line + 1))
-        return result
+import time
+from types import CodeType
+from typing import TYPE_CHECKING, Any, Hashable, Iterable
+
+from rich.text import Text
+from textual import events, work
+
+from base_widget import BaseWidget
+from detail_store import DetailStore
+from details import (
+    BytecodeMode,
+    Detail,
+    Span,
+    bytecode_details,
+    code_object_details,
+    code_object_header,
+    module_code_objects,
+    nested_code_object,
+    nested_code_objects,
+    runtime_details,
+)
+from diff import instruction_key
+from pipeline import VERSION_3_13
+
+if TYPE_CHECKING:
+    from runtime import RuntimeProfile
+
+# The pipeline stage shown in each mode
+_STAGES: dict[BytecodeMode, str] = {
+    "pseudo": "pseudo_bc",
+    "optimized": "opt_bc",
+    "compiled": "code_obj",
+}
+
+
+# A nested code object, as the indices among the code objects in the constants
+# of each code object from the module down
+CodePath = tuple[int, ...]
+
+# The markers of the rows standing for nested code objects
+COLLAPSED = "▶ "
+EXPANDED = "▼ "
+
+
+def collapsed_rows(codes: list[CodeType], level: int) -> list[Detail]:
+    """A collapsed row for each of codes, spanning its lines"""
+    return [code_object_header(co, level, COLLAPSED) for co in codes]
 
 
 class BytecodeWidget(BaseWidget):
+    """
+    The disassembly of the module, with a collapsible tree of the code objects
+    nested in it.
+
+    Clicking the row of a nested code object expands it. Its disassembly is
+    only computed then, in a worker, so opening a module with many functions
+    costs no more than its module level code. Expanded code objects stay
+    expanded when the code changes.
+
+    Given the profile of a run, the panel shows every code object that ran
+    instead, specialized, with the number of samples of each instruction.
+    """
 
     mode: BytecodeMode
+    # Shows this run of the code instead of its static disassembly
+    runtime: RuntimeProfile | None = None
 
     def __init__(self, *args: Any, mode: BytecodeMode, **kwargs: Any) -> None:
         if mode != "compiled" and not VERSION_3_13:
@@ -136,36 +74,141 @@ class BytecodeWidget(BaseWidget):
             )
         super().__init__(*args, **kwargs)
         self.mode = mode
-
-    def set_code(self, code: str) -> None:
-        filename = "<source>"
-        if VERSION_3_13:
-            insts, metadata = compiler_codegen(ast.parse(code, optimize=1), filename, 0)
-            co_consts = [
-                p[1] for p in sorted([(v, k) for k, v in metadata["consts"].items()])
-            ]
-
-            if self.mode in ("optimized", "compiled"):
-                # Optimize
-                nlocals = 0
-                insts = optimize_cfg(insts, co_consts, nlocals)
-
-            if self.mode == "compiled":
-                # Assemble
-                metadata["consts"] = {name: i for i, name in enumerate(co_consts)}
-                from test.test_compiler_assemble import IsolatedAssembleTests
-
-                IsolatedAssembleTests().complete_metadata(metadata)
-                co = assemble_code_object(filename, insts, metadata)
-                bytecode = dis.Bytecode(co)
-                output = list(bytecode)
-            else:
-                output = insts.get_instructions()
-
-            self.update(_disassemble(output, co_consts, f"<{self.mode} bytecode>"))
+        self.stage = _STAGES[mode]
+        # The code the details were last requested for
+        self._code = ""
+        # The details of the module, with collapsed rows for its code objects
+        self._module_details = DetailStore()
+        self._expanded: set[CodePath] = set()
+        # The details of the expanded code objects, for the current code
+        self._children: dict[CodePath, DetailStore] = {}
+        # The code object of each collapsible row shown
+        self._row_paths: dict[int, CodePath] = {}
+
+    def details(
+        self, code: str, spans: list[Span | None] | None = None
+    ) -> Iterable[Detail]:
+        return self._module_rows(code, self.mode, spans)
+
+    def base_details(self, code: str) -> Iterable[Detail]:
+        if self.mode != "optimized":
+            raise ValueError(f"mode={self.mode!r} has no previous stage to diff with")
+        return self._module_rows(code, "pseudo")
+
+    def _module_rows(
+        self, code: str, mode: BytecodeMode, spans: list[Span | None] | None = None
+    ) -> list[Detail]:
+        """
+        The disassembly of the module, followed by a collapsed row for each of
+        the code objects in its constants
+        """
+        details = bytecode_details(self.pipeline, code, mode, spans)
+        nested = collapsed_rows(module_code_objects(self.pipeline, code, mode), 0)
+        if spans is not None:
+            spans.extend([None] * len(nested))
+        return details + nested
+
+    def diff_key(self, text: str) -> Hashable:
+        # Ignores line numbers and jump offsets
+        return instruction_key(text)
+
+    def cached_details(self, code: str) -> DetailStore:
+        self._code = code
+        profile = self.runtime
+        if profile is None:
+            return super().cached_details(code)
+        # Not cached, runs differ
+        started = time.perf_counter()
+        store = DetailStore.from_details(runtime_details(profile))
+        self.compute_time = time.perf_counter() - started
+        return store
+
+    def show_message(self, message: str | Text) -> None:
+        self._row_paths = {}
+        super().show_message(message)
+
+    def _update(self, store: DetailStore) -> None:
+        self._module_details = store
+        self._children = {}
+        self._show_tree()
+        # A diff or a run has no collapsed rows to expand
+        if self._expanded and not self.diff and self.runtime is None:
+            self.load_children(self._code, sorted(self._expanded))
+
+    def _show_tree(self) -> None:
+        # Slices of the stores of the code objects shown, in order
+        parts: list[DetailStore] = []
+        row_paths: dict[int, CodePath] = {}
+        rows = 0
+
+        def add_rows(store: DetailStore) -> None:
+            nonlocal rows
+            parts.append(store)
+            rows += len(store)
+
+        def add(store: DetailStore, parent: CodePath) -> None:
+            prefix = "    " * len(parent) + COLLAPSED
+            done = 0
+            for index, row in enumerate(store.find_rows(prefix)):
+                add_rows(store[done:row])
+                done = row + 1
+                path = (*parent, index)
+                row_paths[rows] = path
+                if path not in self._expanded:
+                    add_rows(store[row:done])
+                    continue
+                expanded = store[row].replace(COLLAPSED, EXPANDED, 1)
+                add_rows(
+                    DetailStore.from_details(
+                        [(expanded, store.start(row), store.end(row))],
+                        [store.span(row)],
+                    )
+                )
+                children = self._children.get(path)
+                if children is not None:
+                    add(children, path)
+            add_rows(store[done:])
+
+        add(self._module_details, ())
+        super()._update(DetailStore.concat(parts))
+        self._row_paths = row_paths
+
+    def on_click(self, event: events.Click) -> None:
+        row = self.row_at(event.y)
+        if row >= len(self.store):
+            return
+        path = self._row_paths.get(self.unfiltered_row(row))
+        if path is None:
+            return
+        if path in self._expanded:
+            self._expanded.remove(path)
         else:
-            assert self.mode == "compiled"
-            co = compile(code, filename, "exec")
-            insts = list(dis.Bytecode(co))
-            co_consts = co.co_consts
-            self.update(_disassemble(insts, co_consts, f"<{self.mode} bytecode>"))
+            self._expanded.add(path)
+            if path not in self._children:
+                self.load_children(self._code, [path])
+        self._show_tree()
+
+    @work(thread=True, group="children")
+    def load_children(self, code: str, paths: list[CodePath]) -> None:
+        """Disassemble nested code objects off the event loop"""
+        children: dict[CodePath, DetailStore] = {}
+        try:
+            for path in paths:
+                co = nested_code_object(self.pipeline, code, self.mode, path)
+                if co is not None:
+                    spans: list[Span | None] = []
+                    details = code_object_details(co, len(path), spans)
+                    nested = collapsed_rows(
+                        nested_code_objects(co.co_consts), len(path)
+                    )
+                    spans.extend([None] * len(nested))
+                    children[path] = DetailStore.from_details(details + nested, spans)
+        except Exception:
+            return  # The panel shows the error already
+        self.app.call_from_thread(self._show_children, code, children)
+
+    def _show_children(self, code: str, children: dict[CodePath, DetailStore]) -> None:
+        if code != self._code:
+            return  # The code changed meanwhile
+        self._children.update(children)
+        self._show_tree()
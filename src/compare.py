@@ -0,0 +1,154 @@
+"""
+Comparing the compiler output of several interpreters for the same source, e.g.
+to see whether upgrading Python grows or shrinks the bytecode of a module.
+
+The pipeline runs under each interpreter at once, in a subprocess running this
+module, which prints the analysis of project.analyze_code as JSON. The results
+are then shown side by side, one row per function, with the instruction counts
+and code sizes under each interpreter, and their difference from the first.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple, TextIO
+
+# Seconds an interpreter is given to compile the source
+COMPARE_TIMEOUT = 60.0
+
+
+class InterpreterResult(NamedTuple):
+    # As given, e.g. python3.12 or a path
+    python: str
+    # e.g. 3.13.0, None if the interpreter didn't run
+    version: str | None
+    # See project.analyze_code, None on error
+    analysis: dict[str, Any] | None
+    error: str | None
+
+
+def analyze_with(python: str, code: str, filename: str) -> InterpreterResult:
+    """The analysis of code by the pipeline under another interpreter"""
+    executable = shutil.which(python)
+    if executable is None:
+        return InterpreterResult(python, None, None, "interpreter not found")
+    try:
+        result = subprocess.run(
+            # Isolated from the environment and user site-packages
+            [executable, "-I", "-B", __file__, filename],
+            input=code,
+            capture_output=True,
+            text=True,
+            timeout=COMPARE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        error = f"still compiling after {COMPARE_TIMEOUT:g} s"
+        return InterpreterResult(python, None, None, error)
+    except OSError as e:
+        return InterpreterResult(python, None, None, str(e))
+    try:
+        record = json.loads(result.stdout)
+    except ValueError:
+        errors = result.stderr.strip().splitlines()
+        error = errors[-1] if errors else f"exit status {result.returncode}"
+        return InterpreterResult(python, None, None, error)
+    return InterpreterResult(
+        python, record["version"], record.get("analysis"), record.get("error")
+    )
+
+
+def compare(code: str, pythons: list[str], filename: str) -> list[InterpreterResult]:
+    """The analysis of code under each interpreter, in parallel"""
+    with ThreadPoolExecutor(len(pythons)) as executor:
+        return list(
+            executor.map(lambda python: analyze_with(python, code, filename), pythons)
+        )
+
+
+def _delta(value: int, base: int | None) -> str:
+    if base is None or value == base:
+        return str(value)
+    percent = f" {(value - base) / base:+.0%}" if base else ""
+    return f"{value} ({value - base:+}{percent})"
+
+
+def format_comparison(results: list[InterpreterResult]) -> str:
+    """
+    A table of the instruction counts and code sizes in bytes of each function,
+    under each interpreter, with their differences from the first interpreter
+    that compiled the code.
+    """
+    labels = [result.version or result.python for result in results]
+    # Functions are matched by qualified name and first line, in the order
+    # they are found
+    functions: dict[tuple[str, int], list[dict[str, Any] | None]] = {}
+    for i, result in enumerate(results):
+        for function in result.analysis["functions"] if result.analysis else ():
+            key = (function["name"], function["line"])
+            functions.setdefault(key, [None] * len(results))[i] = function
+    totals: list[dict[str, Any] | None] = [result.analysis for result in results]
+    base = next((i for i, total in enumerate(totals) if total is not None), None)
+
+    def cells(row: list[dict[str, Any] | None]) -> list[str]:
+        base_row = row[base] if base is not None else None
+        result = []
+        for counts in row:
+            for field in ("instructions", "code_bytes"):
+                if counts is None:
+                    result.append("-")
+                else:
+                    base_value = base_row[field] if base_row is not None else None
+                    result.append(_delta(counts[field], base_value))
+        return result
+
+    header = ["function", "line"]
+    for label in labels:
+        header += [f"{label} instrs", f"{label} bytes"]
+    rows = [header]
+    for (name, line), row in functions.items():
+        rows.append([name, str(line), *cells(row)])
+    rows.append(["total", "", *cells(totals)])
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    lines = [
+        "  ".join(
+            cell.ljust(width) if column == 0 else cell.rjust(width)
+            for column, (cell, width) in enumerate(zip(row, widths))
+        ).rstrip()
+        for row in rows
+    ]
+    for label, result in zip(labels, results):
+        if result.error is not None:
+            lines.append(f"{label}: {result.error}")
+    return "\n".join(lines)
+
+
+def write_comparison(results: list[InterpreterResult], output: TextIO) -> None:
+    """Write the result of each interpreter to output, one JSON record per line"""
+    for result in results:
+        output.write(json.dumps(result._asdict()))
+        output.write("\n")
+
+
+def _analyze(filename: str) -> None:
+    """Print the analysis of the code read from stdin, as JSON"""
+    # Only needed in the interpreters compared
+    from project import analyze_code
+
+    record: dict[str, Any] = {"version": platform.python_version()}
+    try:
+        record["analysis"] = analyze_code(sys.stdin.read(), filename)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    json.dump(record, sys.stdout)
+
+
+if __name__ == "__main__":
+    # Not on the path in isolated mode
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    _analyze(sys.argv[1])
@@ -0,0 +1,223 @@
+"""
+Column-wise storage of the details shown by a panel.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+from typing import Iterable, Iterator, overload
+
+from details import Detail, Span, key_span, span_keys
+
+
+class DetailStore(Sequence[str]):
+    """
+    The details of a panel, as a sequence of the texts of their rows.
+
+    The texts are stored in a single string, separated by newlines, with the
+    offset of each row in it. Start and end lines are stored in int arrays. A
+    row costs 16 bytes on top of its text, rather than a tuple, a string and two
+    ints. Slicing returns a view sharing the columns, without copying them.
+
+    The spans of the rows, if the details have any, are stored as two more
+    columns: the keys of their start and end positions, see details.span_keys.
+    """
+
+    def __init__(
+        self,
+        text: str = "",
+        offsets: array | None = None,
+        starts: array | None = None,
+        ends: array | None = None,
+        rows: range | None = None,
+        spans: tuple[array, array] | None = None,
+    ) -> None:
+        # Row r is text[offsets[r] : offsets[r + 1] - 1]. The last offset is
+        # one past the end of text, as if it ended with a newline
+        self._text = text
+        self._offsets = offsets if offsets is not None else array("q", [0])
+        self._starts = starts if starts is not None else array("i")
+        self._ends = ends if ends is not None else array("i")
+        assert len(self._offsets) == len(self._starts) + 1 == len(self._ends) + 1
+        # The rows of the columns in this store, all but in slices
+        self._rows = rows if rows is not None else range(len(self._starts))
+        self._width: int | None = None
+        # The start and end keys of the span of each row, empty for rows
+        # without one. None if no row has one
+        self._spans = spans
+        assert spans is None or len(spans[0]) == len(spans[1]) == len(self._starts)
+
+    @classmethod
+    def from_details(
+        cls, details: Iterable[Detail], spans: Sequence[Span | None] | None = None
+    ) -> DetailStore:
+        """
+        A store of details, with the span of each row if spans has one per row.
+        spans is read once details are, so it may be filled as they are computed
+        """
+        texts = []
+        offsets = array("q", [0])
+        starts = array("i")
+        ends = array("i")
+        offset = 0
+        width = 0
+        for text, start, end in details:
+            texts.append(text)
+            offset += len(text) + 1
+            offsets.append(offset)
+            starts.append(start)
+            ends.append(end)
+            width = max(width, len(text))
+        store = cls("\n".join(texts), offsets, starts, ends)
+        store._width = width
+        if spans is not None and len(spans) == len(starts):
+            span_starts = array("q")
+            span_ends = array("q")
+            for span in spans:
+                start, end = span_keys(span)
+                span_starts.append(start)
+                span_ends.append(end)
+            store._spans = (span_starts, span_ends)
+        return store
+
+    @classmethod
+    def concat(cls, stores: Iterable[DetailStore]) -> DetailStore:
+        """The rows of all the stores, one after the other"""
+        stores = [store for store in stores if store]
+        texts = []
+        offsets = array("q", [0])
+        starts = array("i")
+        ends = array("i")
+        width = 0
+        for store in stores:
+            texts.append(store.text)
+            base = offsets[-1] - store._offsets[store._rows.start]
+            offsets.extend(store._offsets[row + 1] + base for row in store._rows)
+            starts.extend(store.starts)
+            ends.extend(store.ends)
+            width = max(width, store.width)
+        result = cls("\n".join(texts), offsets, starts, ends)
+        result._width = width
+        if any(store._spans is not None for store in stores):
+            span_starts = array("q")
+            span_ends = array("q")
+            for store in stores:
+                columns = store.span_columns
+                if columns is None:
+                    span_starts.extend(array("q", [0]) * len(store))
+                    span_ends.extend(array("q", [0]) * len(store))
+                else:
+                    span_starts.extend(columns[0])
+                    span_ends.extend(columns[1])
+            result._spans = (span_starts, span_ends)
+        return result
+
+    def take(self, rows: Iterable[int]) -> DetailStore:
+        """A store of the given rows"""
+        rows = list(rows)
+        spans = None if self._spans is None else [self.span(row) for row in rows]
+        return DetailStore.from_details(
+            ((self[row], self.start(row), self.end(row)) for row in rows), spans
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> DetailStore: ...
+
+    def __getitem__(self, index: int | slice) -> str | DetailStore:
+        if isinstance(index, slice):
+            rows = self._rows[index]
+            if rows.step != 1:
+                raise ValueError("DetailStore slices must be contiguous")
+            return DetailStore(
+                self._text, self._offsets, self._starts, self._ends, rows, self._spans
+            )
+        row = self._rows[index]
+        return self._text[self._offsets[row] : self._offsets[row + 1] - 1]
+
+    def columns(self) -> tuple[str, array, array, array]:
+        """The text, offsets, starts and ends columns, copied for a slice"""
+        if self._rows != range(len(self._starts)):
+            return DetailStore.concat([self]).columns()
+        return self._text, self._offsets, self._starts, self._ends
+
+    def start(self, row: int) -> int:
+        """The first source line of a row"""
+        return self._starts[self._rows[row]]
+
+    def end(self, row: int) -> int:
+        return self._ends[self._rows[row]]
+
+    def span(self, row: int) -> Span | None:
+        """The span of source a row stands for, if known"""
+        if self._spans is None:
+            return None
+        row = self._rows[row]
+        return key_span(self._spans[0][row], self._spans[1][row])
+
+    @property
+    def span_columns(self) -> tuple[memoryview, memoryview] | None:
+        """The start and end keys of the spans of the rows, None without spans"""
+        if self._spans is None:
+            return None
+        first, last = self._rows.start, self._rows.stop
+        return (
+            memoryview(self._spans[0])[first:last],
+            memoryview(self._spans[1])[first:last],
+        )
+
+    def details(self) -> Iterator[Detail]:
+        for row in range(len(self)):
+            yield self[row], self.start(row), self.end(row)
+
+    @property
+    def text(self) -> str:
+        """The texts of the rows, separated by newlines"""
+        if not self._rows:
+            return ""
+        first, last = self._rows.start, self._rows.stop
+        return self._text[self._offsets[first] : self._offsets[last] - 1]
+
+    @property
+    def starts(self) -> Sequence[int]:
+        return memoryview(self._starts)[self._rows.start : self._rows.stop]
+
+    @property
+    def ends(self) -> Sequence[int]:
+        return memoryview(self._ends)[self._rows.start : self._rows.stop]
+
+    @property
+    def width(self) -> int:
+        """The length of the longest row"""
+        if self._width is None:
+            offsets = self._offsets
+            self._width = max(
+                (offsets[row + 1] - offsets[row] - 1 for row in self._rows),
+                default=0,
+            )
+        return self._width
+
+    def find_rows(self, prefix: str) -> list[int]:
+        """The rows starting with prefix, found by searching the text column"""
+        text = self._text
+        offsets = self._offsets
+        first, last = self._rows.start, self._rows.stop
+        start, end = offsets[first], offsets[last] - 1
+        result = []
+        if first < last and text.startswith(prefix, start, end):
+            result.append(0)
+        pos = text.find("\n" + prefix, start, end)
+        while pos != -1:
+            row = bisect_right(offsets, pos + 1, first, last) - 1
+            # Unless the newline is part of a row's text
+            if offsets[row] == pos + 1:
+                result.append(row - first)
+            pos = text.find("\n" + prefix, pos + 1, end)
+        return result
@@ -0,0 +1,558 @@
+"""
+The details shown in each panel, one per row: the text of the row and the range
+of source lines it corresponds to. Tokens, AST nodes and instructions also have
+the span of source they stand for, down to the column, given apart from the
+details to the lists passed as spans.
+
+Nothing here depends on Textual, so the details can also be computed headless,
+e.g. to export them.
+"""
+
+from __future__ import annotations
+
+import ast
+import dis
+import tokenize
+from token import tok_name
+from types import CodeType
+from typing import TYPE_CHECKING, Any, Iterable, Literal, Sequence, TypeAlias
+
+from pipeline import VERSION_3_13, Pipeline
+
+if TYPE_CHECKING:
+    from runtime import RuntimeProfile
+
+Detail: TypeAlias = tuple[
+    str, int, int
+]  # data to show, start and end line. python-style range
+
+Span: TypeAlias = tuple[
+    int, int, int, int
+]  # start line and column, end line and column, the end excluded. Columns are
+# UTF-8 byte offsets, as in the AST and dis.Positions
+
+# Positions are packed into one int that orders them like (line, column)
+_COLUMN_BITS = 32
+_COLUMN_MASK = (1 << _COLUMN_BITS) - 1
+
+
+def position_key(line: int, column: int) -> int:
+    return line << _COLUMN_BITS | column
+
+
+def span_keys(span: Span | None) -> tuple[int, int]:
+    """The keys of the start and end of a span, an empty range for None"""
+    if span is None:
+        return 0, 0
+    line, column, end_line, end_column = span
+    return position_key(line, column), position_key(end_line, end_column)
+
+
+def key_span(start: int, end: int) -> Span | None:
+    """The span of the keys of its start and end, None for an empty range"""
+    if start >= end:
+        return None
+    return (
+        start >> _COLUMN_BITS,
+        start & _COLUMN_MASK,
+        end >> _COLUMN_BITS,
+        end & _COLUMN_MASK,
+    )
+
+
+def byte_column(line: str, column: int) -> int:
+    """A column of line in characters, as a UTF-8 byte offset"""
+    if line.isascii():
+        return column
+    return len(line[:column].encode("utf-8", "surrogatepass"))
+
+
+def char_column(line: str, column: int) -> int:
+    """A UTF-8 byte offset in line, as a column in characters"""
+    if line.isascii():
+        return column
+    encoded = line.encode("utf-8", "surrogatepass")
+    return len(encoded[:column].decode("utf-8", "ignore"))
+
+
+# Tokens
+
+
+def token_text(token: tokenize.TokenInfo) -> str:
+    """The part of a token's row that doesn't depend on its position"""
+    return f"{tok_name[token.exact_type]:10} {token.string!r}"
+
+
+def format_row(
+    text: str, line: int, col: int, end_line: int, end_col: int, current_line: int
+) -> Detail:
+    if end_line != line:
+        line_marker = f"{line:4d}-{end_line}: "
+    elif line != current_line:
+        line_marker = f"{line:4d}: "
+    else:
+        line_marker = "      "
+
+    return (
+        f"{line_marker}{text} start=({line}, {col}) end=({end_line}, {end_col})",
+        line,
+        end_line + 1,
+    )
+
+
+def format_token(token: tokenize.TokenInfo, current_line: int) -> Detail:
+    return format_row(token_text(token), *token.start, *token.end, current_line)
+
+
+def token_span(token: tokenize.TokenInfo) -> Span:
+    (line, column), (end_line, end_column) = token.start, token.end
+    if not token.line.isascii():
+        # The physical lines of the token, from its first
+        lines = token.line.splitlines(keepends=True)
+        if lines:
+            column = byte_column(lines[0], column)
+        if end_line - line < len(lines):
+            end_column = byte_column(lines[end_line - line], end_column)
+    return line, column, end_line, end_column
+
+
+def token_details(
+    pipeline: Pipeline, code: str, spans: list[Span | None] | None = None
+) -> list[Detail]:
+    details: list[Detail] = []
+    current_line = 0
+    for t in pipeline.tokens(code):
+        d = format_token(t, current_line)
+        details.append(d)
+        current_line = d[1]
+    if spans is not None:
+        spans.extend(token_span(t) for t in pipeline.tokens(code))
+    return details
+
+
+# AST
+
+
+# Returned by getattr for fields missing from a node
+_MISSING: Any = ...
+# Field values shown as nested lines
+_CHILD_TYPES = (list, ast.AST)
+# The contexts shown by name instead of by repr
+_CONTEXTS = (ast.Load, ast.Store, ast.Del)
+# The per-class information needed to format a node: the class name, its fields,
+# the prefix for each field, and whether it is a statement with a body
+_ClassInfo: TypeAlias = tuple[str, tuple[str, ...], tuple[str, ...], bool]
+_class_info_cache: dict[type, _ClassInfo] = {}
+
+
+def _class_info(cls: type) -> _ClassInfo:
+    info = _class_info_cache.get(cls)
+    if info is None:
+        fields = cls._fields  # type: ignore[attr-defined]
+        info = _class_info_cache[cls] = (
+            cls.__name__,
+            fields,
+            tuple(f"{name}=" for name in fields),
+            "body" in fields,
+        )
+    return info
+
+
+def _has_children(node: ast.AST, values: list[Any]) -> bool:
+    if isinstance(node, ast.Name):
+        return False
+    for value in values:
+        if isinstance(value, _CHILD_TYPES):
+            return True
+    return False
+
+
+def _attr_repr(value: Any) -> str:
+    if isinstance(value, _CONTEXTS):
+        return value.__class__.__name__
+    return repr(value)
+
+
+def _leaf_repr(name: str, prepends: tuple[str, ...], values: list[Any]) -> str:
+    args = ", ".join(
+        [f"{prepend}{_attr_repr(value)}" for prepend, value in zip(prepends, values)]
+    )
+    return f"{name}({args})"
+
+
+def _node_span(node: ast.AST, default: Span | None) -> Span | None:
+    """The span of a node, or default for nodes without a position"""
+    line = getattr(node, "lineno", None)
+    end_line = getattr(node, "end_lineno", None)
+    column = getattr(node, "col_offset", None)
+    end_column = getattr(node, "end_col_offset", None)
+    if line is None or end_line is None or column is None or end_column is None:
+        return default
+    return line, column, end_line, end_column
+
+
+def dump_iter(
+    node: ast.AST, level: int = 0, spans: list[Span | None] | None = None
+) -> Iterable[Detail]:
+    """
+    Yield one detail for each line of an indented dump of the tree, starting at
+    the given indentation level. If spans is given, the span of the node of
+    each line is appended to it as the line is yielded.
+
+    The tree is walked with an explicit stack instead of recursive generators, so
+    each line costs the same regardless of its depth, and deeply nested trees
+    don't hit the recursion limit.
+    """
+    indent = "    "
+
+    # Values still to format, in reverse order: (value, level, last_line,
+    # prepend, span of the closest node)
+    stack: list[tuple[Any, int, int, str, Span | None]] = [(node, level, 0, "", None)]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        value, level, last_line, prepend, span = pop()
+        if isinstance(value, ast.AST):
+            name, fields, prepends, has_body = _class_info(value.__class__)
+            values = [getattr(value, field, _MISSING) for field in fields]
+            start = getattr(value, "lineno", last_line)
+            if spans is not None:
+                span = _node_span(value, span)
+            if not has_body:
+                end = getattr(value, "end_lineno", start) + 1
+            else:
+                # For statements with body, we only associate them with the first
+                # line in the statement. Otherwise, a hover in a nested statement
+                # will try to highlight every containing statement.
+                end = start + 1
+
+            if not _has_children(value, values):
+                if spans is not None:
+                    spans.append(span)
+                yield f"{indent*level}{prepend}{_leaf_repr(name, prepends, values)}", start, end
+                continue
+            if spans is not None:
+                spans.append(span)
+            yield f"{indent*level}{prepend}{name}()", start, end
+            level += 1
+            for i in range(len(values) - 1, -1, -1):
+                if values[i] is not _MISSING:
+                    push((values[i], level, start, prepends[i], span))
+        elif isinstance(value, list | tuple):
+            if len(value) == 1:
+                # Show a single child without children on the same line
+                single = value[0]
+                if not isinstance(single, ast.AST):
+                    if spans is not None:
+                        spans.append(span)
+                    yield f"{indent*level}{prepend}[{single!r}]", last_line, last_line + 1
+                    continue
+                name, fields, prepends, has_body = _class_info(single.__class__)
+                values = [getattr(single, field, _MISSING) for field in fields]
+                if not _has_children(single, values):
+                    start = getattr(single, "lineno", last_line)
+                    end = (
+                        start + 1
+                        if has_body
+                        else getattr(single, "end_lineno", start) + 1
+                    )
+                    if spans is not None:
+                        spans.append(_node_span(single, span))
+                    yield f"{indent*level}{prepend}[{_leaf_repr(name, prepends, values)}]", start, end
+                    continue
+            if spans is not None:
+                spans.append(span)
+            yield f"{indent*level}{prepend}[]", last_line, last_line + 1
+            level += 1
+            for i in range(len(value) - 1, -1, -1):
+                push((value[i], level, last_line, "", span))
+        else:
+            if spans is not None:
+                spans.append(span)
+            yield f"{indent*level}{prepend}{value!r}", last_line, last_line + 1
+
+
+def ast_details(
+    pipeline: Pipeline,
+    code: str,
+    optimized: bool = False,
+    spans: list[Span | None] | None = None,
+) -> list[Detail]:
+    if not optimized:
+        tree = pipeline.tree(code)
+    else:
+        tree = pipeline.optimized_tree(code)
+    return list(dump_iter(tree, spans=spans))
+
+
+# Bytecode
+
+
+BytecodeMode: TypeAlias = Literal["pseudo", "optimized", "compiled"]
+
+PseudoInstruction: TypeAlias = tuple[
+    int, int | None, int, int, int, int
+]  # op, oparg, startline, endline, startcol, endcol
+
+
+if VERSION_3_13:
+
+    class PseudoInstrsArgResolver(dis.ArgResolver):
+        def offset_from_jump_arg(self, op: int, arg: int, offset: int) -> int:
+            if op in dis.hasjump or op in dis.hasexc:
+                return arg
+            return super().offset_from_jump_arg(op, arg, offset)
+
+    class AppendStream:
+        def __init__(self, append_to: list[Detail]) -> None:
+            self.target = append_to
+            self.target_line = 0
+
+        def write(self, line: str) -> None:
+            if line.strip():
+                self.target.append((line, self.target_line, self.target_line + 1))
+
+    class Formatter(dis.Formatter):
+        file: AppendStream
+
+        def print_instruction(
+            self, instr: dis.Instruction, mark_as_current: bool = False
+        ) -> None:
+            if instr.line_number:
+                self.file.target_line = instr.line_number
+            super().print_instruction(instr, mark_as_current=mark_as_current)
+
+
+def _get_instructions(
+    insts: Iterable[PseudoInstruction | dis.Instruction],
+    arg_resolver: PseudoInstrsArgResolver,
+) -> Iterable[dis.Instruction]:
+    prev_line = None
+    for offset, inst in enumerate(insts):
+        if isinstance(inst, dis.Instruction):
+            yield inst
+            continue
+        op, arg = inst[:2]
+        start_offset = 0
+        positions = dis.Positions(*inst[2:6])
+        line_number = positions.lineno if (positions.lineno or 0) > 0 else None
+        starts_line = line_number != prev_line
+        prev_line = line_number
+        label = arg_resolver.labels_map.get(offset, None)
+        argval, argrepr = arg_resolver.get_argval_argrepr(op, arg, offset)
+        yield dis.Instruction(
+            dis._all_opname[op],
+            op,
+            arg,
+            argval,
+            argrepr,
+            offset,
+            start_offset,
+            starts_line,
+            line_number,
+            label,
+            positions,
+        )
+
+
+def _disassemble(
+    insts: Sequence[PseudoInstruction | dis.Instruction],
+    co_consts: Sequence[object],
+    title: str,
+) -> Iterable[Detail]:
+    result: list[Detail] = []
+    if VERSION_3_13:
+        jump_targets = [
+            target for op, target, *_ in insts if op in dis.hasjump or op in dis.hasexc
+        ]
+        labels_map = {offset: i for i, offset in enumerate(jump_targets, start=1)}
+
+        label_width = 4 + len(str(len(labels_map)))
+        arg_resolver = PseudoInstrsArgResolver(
+            co_consts=co_consts, labels_map=labels_map
+        )
+
+        dis.print_instructions(
+            _get_instructions(insts, arg_resolver),
+            None,  # exception_entries
+            Formatter(
+                file=AppendStream(result), lineno_width=6, label_width=label_width
+            ),
+        )
+        return result
+    else:
+        line = 0
+        for i in insts:
+            assert isinstance(i, dis.Instruction)
+            if i.positions:
+                line = i.positions.lineno or line
+            result.append((i._disassemble(), line, line + 1))
+        return result
+
+
+def _instruction_spans(
+    insts: Sequence[PseudoInstruction | dis.Instruction], rows: int
+) -> list[Span | None]:
+    """The span of each of the rows of the disassembly of insts"""
+    if rows != len(insts):
+        # Not one row per instruction, the rows can't be matched
+        return [None] * rows
+    spans: list[Span | None] = []
+    for inst in insts:
+        if isinstance(inst, dis.Instruction):
+            positions = tuple(inst.positions or (None,) * 4)
+        else:
+            positions = inst[2:6]
+        line, end_line, column, end_column = positions
+        if (
+            line is None
+            or end_line is None
+            or column is None
+            or end_column is None
+            or line <= 0
+            or column < 0
+            or end_column < 0
+        ):
+            spans.append(None)  # Artificial instructions, e.g. RESUME
+        else:
+            spans.append((line, column, end_line, end_column))
+    return spans
+
+
+def _bytecode(
+    pipeline: Pipeline, code: str, mode: BytecodeMode
+) -> tuple[Sequence[PseudoInstruction | dis.Instruction], Sequence[object]]:
+    """The module level instructions and constants of code in the given mode"""
+    if mode == "pseudo":
+        pseudo = pipeline.pseudo_bytecode(code)
+        return pseudo.instructions, pseudo.co_consts
+    elif mode == "optimized":
+        optimized = pipeline.optimized_bytecode(code)
+        return optimized.instructions, optimized.co_consts
+    else:
+        co = pipeline.code_object(code)
+        return list(dis.Bytecode(co)), co.co_consts
+
+
+def bytecode_details(
+    pipeline: Pipeline,
+    code: str,
+    mode: BytecodeMode,
+    spans: list[Span | None] | None = None,
+    recursive: bool = False,
+) -> list[Detail]:
+    """
+    The disassembly of the module. If recursive, followed by that of each of the
+    code objects in its constants (functions, classes, lambdas, comprehensions)
+    and nested in them, depth first, each after a row naming it.
+    """
+    insts, co_consts = _bytecode(pipeline, code, mode)
+    details = list(_disassemble(insts, co_consts, f"<{mode} bytecode>"))
+    if spans is not None:
+        spans.extend(_instruction_spans(insts, len(details)))
+    if recursive:
+        _nested_details(co_consts, 0, details, spans)
+    return details
+
+
+def _nested_details(
+    co_consts: Sequence[object],
+    level: int,
+    details: list[Detail],
+    spans: list[Span | None] | None,
+) -> None:
+    for co in nested_code_objects(co_consts):
+        details.append(code_object_header(co, level))
+        if spans is not None:
+            spans.append(None)
+        details.extend(code_object_details(co, level + 1, spans))
+        _nested_details(co.co_consts, level + 1, details, spans)
+
+
+def nested_code_objects(co_consts: Sequence[object]) -> list[CodeType]:
+    """The code objects in co_consts, in order"""
+    return [co for co in co_consts if isinstance(co, CodeType)]
+
+
+def module_code_objects(
+    pipeline: Pipeline, code: str, mode: BytecodeMode
+) -> list[CodeType]:
+    """The code objects in the constants of the module"""
+    _, co_consts = _bytecode(pipeline, code, mode)
+    return nested_code_objects(co_consts)
+
+
+def nested_code_object(
+    pipeline: Pipeline, code: str, mode: BytecodeMode, path: tuple[int, ...]
+) -> CodeType | None:
+    """
+    Follow a path of indices among the code objects in the constants of each
+    code object, from the module down. None if there is no such code object.
+
+    The code objects are always assembled: codegen only exposes the pseudo
+    bytecode of the module itself, not of the code objects nested in it.
+    """
+    _, co_consts = _bytecode(pipeline, code, mode)
+    co = None
+    for i in path:
+        codes = nested_code_objects(co_consts)
+        if i >= len(codes):
+            return None
+        co = codes[i]
+        co_consts = co.co_consts
+    return co
+
+
+def code_object_header(co: CodeType, level: int, marker: str = "") -> Detail:
+    """A row naming a code object, indented to its level, spanning its lines"""
+    start = co.co_firstlineno
+    end = max((line for *_, line in co.co_lines() if line), default=start)
+    name = getattr(co, "co_qualname", co.co_name)
+    text = f"{'    ' * level}{marker}<code object {name}>, line {start}"
+    return (text, start, end + 1)
+
+
+def code_object_details(
+    co: CodeType, level: int, spans: list[Span | None] | None = None
+) -> list[Detail]:
+    """The disassembly of a nested code object, indented to its level"""
+    indent = "    " * level
+    insts = list(dis.Bytecode(co))
+    details = [
+        (f"{indent}{text}", start, end)
+        for text, start, end in _disassemble(insts, co.co_consts, co.co_name)
+    ]
+    if spans is not None:
+        spans.extend(_instruction_spans(insts, len(details)))
+    return details
+
+
+def runtime_details(profile: RuntimeProfile) -> list[Detail]:
+    """
+    The disassembly of each code object that ran, as the interpreter
+    specialized it, with the number of samples each instruction ran in.
+    """
+    # Only needed after a run, see runtime
+    from runtime import FILENAME, code_objects
+
+    module = compile(profile.code, FILENAME, "exec")
+    details: list[Detail] = []
+    for path, co in code_objects(module):
+        counts = profile.instructions.get(path)
+        if counts is None:
+            continue  # Never ran
+        specialized = profile.specialized.get(path, {})
+        indent = "    " * len(path)
+        details.append(code_object_header(co, len(path)))
+        instructions = [
+            instruction._replace(
+                opname=specialized.get(instruction.offset, instruction.opname)
+            )
+            for instruction in dis.get_instructions(co)
+        ]
+        rows = _disassemble(instructions, co.co_consts, co.co_name)
+        # One row per instruction
+        for instruction, (text, start, end) in zip(instructions, rows):
+            count = counts.get(instruction.offset, "")
+            details.append((f"{indent}{count:>6} {text}", start, end))
+    return details
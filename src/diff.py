@@ -0,0 +1,286 @@
+"""
+The changes between the details of two stages, e.g. what AST optimization or
+optimize_cfg did, aligned with Myers' O(ND) difference algorithm.
+
+The alignment uses linear space: the middle snake of each sub-problem is found
+by searching from both ends at once, then both halves are aligned in turn,
+without keeping the paths searched. Rows found in only one of the stages can't
+be aligned, and are left out of the search beforehand.
+"""
+
+from __future__ import annotations
+
+import re
+from math import isqrt
+from heapq import merge
+from typing import Callable, Hashable, Literal, Sequence, TypeAlias
+
+from detail_store import DetailStore
+from details import Detail
+
+Opcode: TypeAlias = tuple[
+    Literal["equal", "replace", "delete", "insert"], int, int, int, int
+]  # tag, a[i1:i2] becomes b[j1:j2], like difflib
+
+# A run of aligned rows: a[i : i + n] == b[j : j + n]
+Block: TypeAlias = tuple[int, int, int]
+
+# The search for a middle snake gives up after this many edits from each end,
+# and splits at the furthest point reached instead. The alignment is then not
+# always the shortest, but the time stays bounded when little is in common
+MAX_COST = 256
+# The number of edits searched for a whole alignment, roughly the sum of the
+# squares of the costs searched for each sub-problem. Once spent, what is left
+# is replaced as a whole
+BUDGET = 2_000_000
+
+# The prefix of each kind of row of a diff
+UNCHANGED = "  "
+REMOVED = "- "
+INSERTED = "+ "
+# A changed row is shown as it was, then as it is
+CHANGED_FROM = "< "
+CHANGED_TO = "> "
+
+
+def _split_point(
+    a: Sequence[int],
+    alo: int,
+    ahi: int,
+    b: Sequence[int],
+    blo: int,
+    bhi: int,
+    max_cost: int,
+) -> tuple[int, int, int]:
+    """
+    A point of a shortest path from (alo, blo) to (ahi, bhi) through the edit
+    graph, near its middle, found by searching from both ends, and the number
+    of edits searched from each end.
+
+    The first and last items of a and b must differ. Paths that run off the
+    graph are dropped from the search, as in diff-match-patch's bisect.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    # The furthest x reached on each diagonal k = x - y, from the start and
+    # from the end. -1 for diagonals not reached yet
+    forward = [-1] * (2 * offset + 1)
+    backward = [-1] * (2 * offset + 1)
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    # With an odd delta, the paths from both ends meet after a forward step
+    odd = delta % 2 != 0
+    # Diagonals left out at each end, after running off the graph
+    fstart = fend = bstart = bend = 0
+    for d in range(max_d + 1):
+        for k in range(-d + fstart, d + 1 - fend, 2):
+            i = offset + k
+            if k == -d or (k != d and forward[i - 1] < forward[i + 1]):
+                x = forward[i + 1]
+            else:
+                x = forward[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[i] = x
+            if x > n:
+                fend += 2
+            elif y > m:
+                fstart += 2
+            elif odd:
+                j = offset + delta - k
+                if 0 <= j < len(backward) and backward[j] != -1:
+                    if x >= n - backward[j]:
+                        return alo + x, blo + y, d
+        for k in range(-d + bstart, d + 1 - bend, 2):
+            i = offset + k
+            if k == -d or (k != d and backward[i - 1] < backward[i + 1]):
+                x = backward[i + 1]
+            else:
+                x = backward[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            backward[i] = x
+            if x > n:
+                bend += 2
+            elif y > m:
+                bstart += 2
+            elif not odd:
+                j = offset + delta - k
+                if 0 <= j < len(forward) and forward[j] != -1:
+                    fx = forward[j]
+                    if fx >= n - x:
+                        return alo + fx, blo + fx - (delta - k), d
+        if d >= max_cost:
+            break
+    # Too costly, split at the furthest point reached from the start
+    best = (0, 0)
+    for k in range(-d + fstart, d + 1 - fend, 2):
+        x = forward[offset + k]
+        if 0 <= x <= n and 0 <= x - k <= m and x + x - k > best[0] + best[1]:
+            best = (x, x - k)
+    return alo + best[0], blo + best[1], d
+
+
+def _align(a: Sequence[int], b: Sequence[int]) -> list[Block]:
+    """The runs of aligned items of a and b, in order"""
+    blocks: list[Block] = []
+    # The sub-problems left, (alo, ahi, blo, bhi), solved with a stack rather
+    # than recursion so that long inputs don't hit the recursion limit
+    stack = [(0, len(a), 0, len(b))]
+    budget = BUDGET
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        start = alo
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            alo += 1
+            blo += 1
+        if alo > start:
+            blocks.append((start, blo - (alo - start), alo - start))
+        end = ahi
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+        if ahi < end:
+            blocks.append((ahi, bhi, end - ahi))
+        if alo == ahi or blo == bhi:
+            continue  # Only deletions or only insertions left
+        if budget <= 0:
+            continue  # Replaced as a whole
+        x, y, cost = _split_point(
+            a, alo, ahi, b, blo, bhi, min(MAX_COST, isqrt(budget))
+        )
+        budget -= cost * cost
+        if (x, y) in ((alo, blo), (ahi, bhi)):
+            continue  # Nothing in common
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+    blocks.sort()
+    return blocks
+
+
+def matching_blocks(a: Sequence[Hashable], b: Sequence[Hashable]) -> list[Block]:
+    """
+    The runs of equal items of a longest common subsequence of a and b, in
+    order, followed by (len(a), len(b), 0) like difflib.
+    """
+    # Items are compared as ints
+    codes: dict[Hashable, int] = {}
+    a_codes = [codes.setdefault(item, len(codes)) for item in a]
+    b_codes = [codes.setdefault(item, len(codes)) for item in b]
+    # Items in only one of a or b are never aligned
+    in_a = set(a_codes)
+    in_b = set(b_codes)
+    a_kept = [i for i, code in enumerate(a_codes) if code in in_b]
+    b_kept = [j for j, code in enumerate(b_codes) if code in in_a]
+    aligned = _align([a_codes[i] for i in a_kept], [b_codes[j] for j in b_kept])
+
+    # Back to indices in a and b, where runs may have been split by the items
+    # left out
+    blocks: list[Block] = []
+    for x, y, size in aligned:
+        for t in range(size):
+            i = a_kept[x + t]
+            j = b_kept[y + t]
+            if blocks:
+                last_i, last_j, last_size = blocks[-1]
+                if i == last_i + last_size and j == last_j + last_size:
+                    blocks[-1] = (last_i, last_j, last_size + 1)
+                    continue
+            blocks.append((i, j, 1))
+    blocks.append((len(a), len(b), 0))
+    return blocks
+
+
+def opcodes(a: Sequence[Hashable], b: Sequence[Hashable]) -> list[Opcode]:
+    """How to turn a into b, like difflib.SequenceMatcher.get_opcodes"""
+    result: list[Opcode] = []
+    i = j = 0
+    for block_i, block_j, size in matching_blocks(a, b):
+        if i < block_i and j < block_j:
+            result.append(("replace", i, block_i, j, block_j))
+        elif i < block_i:
+            result.append(("delete", i, block_i, j, j))
+        elif j < block_j:
+            result.append(("insert", i, i, j, block_j))
+        i = block_i + size
+        j = block_j + size
+        if size:
+            result.append(("equal", block_i, i, block_j, j))
+    return result
+
+
+# The line number column of a disassembly row, and an argument followed by
+# what it stands for, e.g. the index of a constant or the offset of a jump.
+# Both change whenever the instructions or constants before them do
+_LINE_COLUMN = re.compile(r"^\s*(?:\d+|--)?\s+")
+_RESOLVED_ARG = re.compile(r"\d+ \(")
+
+
+def instruction_key(text: str) -> str:
+    """What must be equal for two disassembly rows to be aligned"""
+    text = _RESOLVED_ARG.sub("(", _LINE_COLUMN.sub("", text, count=1), count=1)
+    return " ".join(text.split())
+
+
+def diff_details(
+    before: Sequence[Detail],
+    after: Sequence[Detail],
+    key: Callable[[str], Hashable] | None = None,
+) -> list[Detail]:
+    """
+    The rows of after, aligned with those of before, each with a prefix: the
+    unchanged rows, then those REMOVED from before, INSERTED in after, or
+    CHANGED_FROM a row of before CHANGED_TO one of after.
+
+    Rows are aligned when their texts are equal, or their keys if given, and
+    then shown as they are in after. A run of rows replaced by as many rows is
+    changed, row by row. Otherwise the removed and inserted rows of a run are
+    interleaved by source line.
+    """
+    if key is None:
+        before_keys: Sequence[Hashable] = [text for text, _, _ in before]
+        after_keys: Sequence[Hashable] = [text for text, _, _ in after]
+    else:
+        before_keys = [key(text) for text, _, _ in before]
+        after_keys = [key(text) for text, _, _ in after]
+
+    result: list[Detail] = []
+
+    def changed(i: int, j: int) -> None:
+        text, start, end = before[i]
+        result.append((CHANGED_FROM + text, start, end))
+        text, start, end = after[j]
+        result.append((CHANGED_TO + text, start, end))
+
+    for tag, i1, i2, j1, j2 in opcodes(before_keys, after_keys):
+        if tag == "equal":
+            for text, start, end in after[j1:j2]:
+                result.append((UNCHANGED + text, start, end))
+        elif tag == "replace" and i2 - i1 == j2 - j1:
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                changed(i, j)
+        else:
+            removed = [
+                (REMOVED + text, start, end) for text, start, end in before[i1:i2]
+            ]
+            inserted = [
+                (INSERTED + text, start, end) for text, start, end in after[j1:j2]
+            ]
+            # Stable: the removed rows of a line come before the inserted ones
+            result.extend(merge(removed, inserted, key=lambda detail: detail[1]))
+    return result
+
+
+def diff_summary(store: DetailStore) -> str:
+    """The number of rows inserted, removed and changed in a diff"""
+    inserted = len(store.find_rows(INSERTED))
+    removed = len(store.find_rows(REMOVED))
+    changed = len(store.find_rows(CHANGED_TO))
+    return f"+{inserted} -{removed} ~{changed}"
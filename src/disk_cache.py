@@ -0,0 +1,138 @@
+"""
+A persistent cache of the details of each stage, so that reopening a file that
+didn't change doesn't run the pipeline again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import marshal
+import os
+import sys
+import threading
+import zlib
+from array import array
+from pathlib import Path
+
+from detail_store import DetailStore
+from pipeline import OPTIMIZE
+
+# Bump when the details computed for a stage change, to ignore older entries
+FORMAT_VERSION = 5
+
+
+def default_directory() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "codoscope"
+
+
+class DiskCache:
+    """
+    The details of each stage, keyed by (source hash, interpreter version, stage,
+    optimize level), one file per entry.
+
+    Entries are the columns of a DetailStore: the texts of the rows, their
+    offsets, the start and end lines, and the keys of their spans if any,
+    marshalled and compressed. The least recently used
+    entries are removed when the cache grows over max_bytes; reading an entry
+    refreshes its modification time.
+
+    The cache is best effort: any error reading or writing an entry is treated as
+    a miss.
+    """
+
+    directory: Path
+    max_bytes: int
+
+    def __init__(
+        self, directory: Path | None = None, max_bytes: int = 100 * 1024 * 1024
+    ) -> None:
+        self.directory = directory if directory is not None else default_directory()
+        self.max_bytes = max_bytes
+        # The total size of the entries, scanned on the first write
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    def _path(self, source_hash: str, stage: str) -> Path:
+        key = repr(
+            (
+                FORMAT_VERSION,
+                source_hash,
+                tuple(sys.version_info),
+                sys.implementation.cache_tag,
+                stage,
+                OPTIMIZE,
+            )
+        )
+        return self.directory / (hashlib.sha1(key.encode()).hexdigest() + ".bin")
+
+    def get(self, source_hash: str, stage: str) -> DetailStore | None:
+        path = self._path(source_hash, stage)
+        try:
+            data = path.read_bytes()
+            text, *column_bytes = marshal.loads(zlib.decompress(data))
+            offsets, starts, ends = array("q"), array("i"), array("i")
+            span_starts, span_ends = array("q"), array("q")
+            columns = (offsets, starts, ends, span_starts, span_ends)
+            for column, column_data in zip(columns, column_bytes):
+                column.frombytes(column_data)
+            spans = (span_starts, span_ends) if len(column_bytes) > 3 else None
+            os.utime(path)
+            return DetailStore(text, offsets, starts, ends, spans=spans)
+        except (OSError, EOFError, ValueError, TypeError, zlib.error):
+            return None
+
+    def put(self, source_hash: str, stage: str, store: DetailStore) -> None:
+        text, *columns = store.columns()
+        column_bytes = [column.tobytes() for column in columns]
+        span_columns = store.span_columns
+        if span_columns is not None:
+            column_bytes.extend(column.tobytes() for column in span_columns)
+        data = zlib.compress(marshal.dumps((text, *column_bytes)), 1)
+        path = self._path(source_hash, stage)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(data)
+            # Atomic, readers never see a partial entry
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        """(last use, size, path) of each entry"""
+        entries = []
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".bin"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # Removed by another process
+                    entries.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+        except OSError:
+            pass
+        return entries
+
+    def _evict(self) -> None:
+        # Down to 3/4 of the limit, so that eviction doesn't run on every write
+        target = self.max_bytes * 3 // 4
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            size -= entry_size
+        self._size = size
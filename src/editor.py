@@ -5,6 +5,8 @@ from textual.screen import Screen
 from textual.message import Message
 from textual.widgets import TextArea, Footer
 
+from pipeline import Pipeline
+
 
 class EditorTextArea(TextArea):
 
@@ -32,17 +34,26 @@ class EditorScreen(Screen[str | None]):
     ]
 
     code: str = ""
+    # Shared with the viewer, so that the stages run to validate the code are
+    # not computed again for the panels
+    pipeline: Pipeline = Pipeline()
 
     def compose(self) -> ComposeResult:
         yield EditorTextArea.code_editor(self.code, language="python")
         yield Footer()
 
     def set_code(self, new_code: str) -> None:
+        if new_code == self.code:
+            return  # Keep the cursor and undo history
         self.code = new_code
+        # Once composed, the editor keeps its own text, e.g. the code from
+        # before a watch reload or a live edit
+        for text_area in self.query(EditorTextArea):
+            text_area.load_text(new_code)
 
     def on_editor_text_area_save(self, message: EditorTextArea.Save):
         try:
-            compile(message.code, "<editor>", "exec")
+            self.pipeline.check(message.code)
             self.code = message.code
             self.dismiss(message.code)
         except SyntaxError as e:
@@ -1,10 +1,42 @@
 from typing import Any
 
 from textual.message import Message
+from textual.widget import Widget
+
+from details import Span
 
 
 class HoverLine(Message):
+    """
+    The mouse is over what comes from a source line: at a column of it, over a
+    row standing for a span of source, or just on the line when neither is known
+    """
 
-    def __init__(self, lineno: int, *args: Any, **kwargs: Any) -> None:
+    def __init__(
+        self,
+        lineno: int,
+        *args: Any,
+        column: int | None = None,
+        span: Span | None = None,
+        **kwargs: Any,
+    ) -> None:
         self.lineno = lineno
+        # A UTF-8 byte offset, as in Span
+        self.column = column
+        self.span = span
+        super().__init__(*args, **kwargs)
+
+
+class SearchMatches(Message):
+    """The source lines of the rows of a panel matching the search"""
+
+    def __init__(
+        self, panel: Widget, lines: list[int], *args: Any, **kwargs: Any
+    ) -> None:
+        self.panel = panel
+        self.lines = lines
         super().__init__(*args, **kwargs)
+
+    @property
+    def control(self) -> Widget:
+        return self.panel
@@ -0,0 +1,89 @@
+"""
+Headless export of the details of each stage, as NDJSON.
+
+Each detail is written as one JSON record, as soon as its stage is computed:
+
+    {"stage": "ast", "text": "Module()", "start_line": 0, "end_line": 1}
+
+The bytecode stages include the disassembly of every nested code object, after
+a row naming it, e.g. "<code object f>, line 1", as the collapsed rows of the
+UI only stand for code objects to expand.
+
+A stage that fails, e.g. with a SyntaxError, is reported with an "error" record
+instead, and the remaining stages are still exported.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Callable, Iterable, TextIO
+
+from details import Detail, ast_details, bytecode_details, token_details
+from pipeline import VERSION_3_13, Pipeline
+from profiling import profiler
+
+# The stages that can be exported, in pipeline order
+if VERSION_3_13:
+    EXPORT_STAGES: dict[str, Callable[[Pipeline, str], Iterable[Detail]]] = {
+        "tokens": token_details,
+        "ast": ast_details,
+        "opt_ast": lambda pipeline, code: ast_details(pipeline, code, optimized=True),
+        "pseudo_bc": lambda pipeline, code: bytecode_details(
+            pipeline, code, "pseudo", recursive=True
+        ),
+        "opt_bc": lambda pipeline, code: bytecode_details(
+            pipeline, code, "optimized", recursive=True
+        ),
+        "code_obj": lambda pipeline, code: bytecode_details(
+            pipeline, code, "compiled", recursive=True
+        ),
+    }
+else:
+    EXPORT_STAGES = {
+        "tokens": token_details,
+        "ast": ast_details,
+        "code_obj": lambda pipeline, code: bytecode_details(
+            pipeline, code, "compiled", recursive=True
+        ),
+    }
+
+
+def export(
+    code: str,
+    output: TextIO,
+    stages: Iterable[str] = EXPORT_STAGES,
+    pipeline: Pipeline | None = None,
+) -> bool:
+    """
+    Write the details of each stage of code to output, one JSON record per line.
+
+    Returns False if any stage failed.
+    """
+    if pipeline is None:
+        pipeline = Pipeline()
+    ok = True
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    write = output.write
+    for stage in stages:
+        # Errors writing, e.g. the reader went away, are left to the caller
+        try:
+            with profiler.measure(f"{stage} format"):
+                details = list(EXPORT_STAGES[stage](pipeline, code))
+        except Exception as e:
+            ok = False
+            write(dumps({"stage": stage, "error": f"{type(e).__name__}: {e}"}))
+            write("\n")
+            continue
+        for text, start_line, end_line in details:
+            write(
+                dumps(
+                    {
+                        "stage": stage,
+                        "text": text,
+                        "start_line": start_line,
+                        "end_line": end_line,
+                    }
+                )
+            )
+            write("\n")
+    return ok
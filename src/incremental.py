@@ -0,0 +1,198 @@
+"""
+Incremental computation of the token and AST details.
+
+The source is split into chunks, one per top-level statement. The details of
+each chunk are cached by its text, so after an edit only the chunks that changed
+are recomputed. The details of the other chunks are reused, with their line
+numbers shifted if lines were added or removed above them.
+"""
+
+from __future__ import annotations
+
+import ast
+import io
+import threading
+import tokenize
+from typing import Callable, Iterable, NamedTuple, TypeAlias
+
+from details import Detail
+
+# A python-style range of 1-based source lines
+LineRange: TypeAlias = tuple[int, int]
+
+
+def source_lines(code: str) -> list[str]:
+    """The lines of code, split like the tokenizer does"""
+    return io.StringIO(code).readlines()
+
+
+def _first_line(stmt: ast.stmt) -> int:
+    decorators = getattr(stmt, "decorator_list", ())
+    return min([stmt.lineno, *(d.lineno for d in decorators)])
+
+
+def top_level_chunks(tree: ast.Module, nlines: int) -> list[LineRange]:
+    """
+    Split the source in ranges of whole lines, one per top-level statement.
+
+    A chunk starts at its statement (or its first decorator) and runs up to the
+    next one, so comments and blank lines belong to the statement above them.
+    Statements sharing a line share a chunk. The first chunk always starts at
+    line 1, and together the chunks cover every line.
+    """
+    starts = [1]
+    prev_end = 0
+    for stmt in tree.body:
+        start = _first_line(stmt)
+        if start > starts[-1] and start > prev_end:
+            starts.append(start)
+        prev_end = stmt.end_lineno or stmt.lineno
+    return list(zip(starts, [*starts[1:], nlines + 1]))
+
+
+# The position of a token: start line, start column, end line, end column
+Position: TypeAlias = tuple[int, int, int, int]
+
+
+class _TokenChunk(NamedTuple):
+    first_line: int
+    # The position independent part of each token's row
+    texts: list[str]
+    # Relative to first_line
+    positions: list[Position]
+    details: list[Detail]
+
+
+class IncrementalTokens:
+    """
+    Token details, retokenizing only the chunks that changed.
+
+    Each chunk is tokenized on its own. Its ENCODING and ENDMARKER tokens are
+    dropped unless it is the first or last chunk, and the DEDENT tokens at its
+    end land on the first line of the next chunk, as they would in the whole
+    file.
+
+    Rows show absolute positions, so a chunk that moved is formatted again, from
+    its cached token texts and relative positions.
+    """
+
+    def __init__(
+        self,
+        token_text: Callable[[tokenize.TokenInfo], str],
+        format_row: Callable[[str, int, int, int, int, int], Detail],
+    ) -> None:
+        self.token_text = token_text
+        self.format_row = format_row
+        # chunk text -> chunk, for the last revision
+        self._chunks: dict[str, _TokenChunk] = {}
+        self._lock = threading.Lock()
+
+    def _chunk(self, text: str, first_line: int) -> _TokenChunk:
+        cached = self._chunks.get(text)
+        if cached is not None and cached.first_line == first_line:
+            return cached
+        if cached is None:
+            tokens = list(tokenize.tokenize(io.BytesIO(text.encode("utf-8")).readline))
+            texts = [self.token_text(t) for t in tokens]
+            positions = [(*t.start, *t.end) for t in tokens]
+            # Make them relative to the chunk, ENCODING is on line 0
+            positions = [(l - 1, c, l2 - 1, c2) for l, c, l2, c2 in positions]
+        else:
+            texts, positions = cached.texts, cached.positions
+
+        format_row = self.format_row
+        details: list[Detail] = []
+        current_line = 0
+        for text, (line, col, end_line, end_col) in zip(texts, positions):
+            d = format_row(
+                text,
+                line + first_line,
+                col,
+                end_line + first_line,
+                end_col,
+                current_line,
+            )
+            details.append(d)
+            current_line = d[1]
+        return _TokenChunk(first_line, texts, positions, details)
+
+    def details(self, code: str, tree: ast.Module) -> list[Detail]:
+        with self._lock:
+            lines = source_lines(code)
+            chunks = top_level_chunks(tree, len(lines))
+            result: list[Detail] = []
+            cache: dict[str, _TokenChunk] = {}
+            current_line = 0
+            for i, (start, end) in enumerate(chunks):
+                text = "".join(lines[start - 1 : end - 1])
+                cache[text] = chunk = self._chunk(text, start)
+                lo = 0 if i == 0 else 1
+                hi = (
+                    len(chunk.details)
+                    if i == len(chunks) - 1
+                    else len(chunk.details) - 1
+                )
+                if lo < hi:
+                    # The marker of the first row depends on the previous chunk
+                    line, col, end_line, end_col = chunk.positions[lo]
+                    result.append(
+                        self.format_row(
+                            chunk.texts[lo],
+                            line + start,
+                            col,
+                            end_line + start,
+                            end_col,
+                            current_line,
+                        )
+                    )
+                    result.extend(chunk.details[lo + 1 : hi])
+                    current_line = result[-1][1]
+            self._chunks = cache
+            return result
+
+
+class IncrementalAST:
+    """
+    AST details, dumping only the top-level statements that changed.
+
+    Statements are keyed by their source text (and columns), which determines
+    their dump. Line numbers only appear in the line ranges of the details, not
+    in their text, so reusing a statement that moved is just a shift.
+    """
+
+    def __init__(self, dump: Callable[[ast.AST, int], Iterable[Detail]]) -> None:
+        self.dump = dump
+        # statement key -> (first line, details), for the last revision
+        self._stmts: dict[tuple[int, int, str], tuple[int, list[Detail]]] = {}
+        self._lock = threading.Lock()
+
+    def details(self, code: str, tree: ast.Module) -> list[Detail]:
+        if len(tree.body) < 2 or tree.type_ignores:
+            # Shown on a single line, or with extra content: nothing to reuse
+            return list(self.dump(tree, 0))
+
+        with self._lock:
+            lines = source_lines(code)
+            result: list[Detail] = [("Module()", 0, 1), ("    body=[]", 0, 1)]
+            cache: dict[tuple[int, int, str], tuple[int, list[Detail]]] = {}
+            for stmt in tree.body:
+                start = _first_line(stmt)
+                end = stmt.end_lineno or stmt.lineno
+                key = (
+                    stmt.col_offset,
+                    stmt.end_col_offset or 0,
+                    "".join(lines[start - 1 : end]),
+                )
+                cached = cache.get(key) or self._stmts.get(key)
+                if cached is None:
+                    details = list(self.dump(stmt, 2))
+                elif cached[0] != start:
+                    delta = start - cached[0]
+                    details = [(t, s + delta, e + delta) for t, s, e in cached[1]]
+                else:
+                    details = cached[1]
+                cache[key] = (start, details)
+                result.extend(details)
+            result.append(("    type_ignores=[]", 0, 1))
+            self._stmts = cache
+            return result
@@ -0,0 +1,123 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Sequence
+
+
+class IntervalIndex:
+    """
+    An index of the source line ranges covered by each row of a panel.
+
+    Row r covers the python-style range of lines starts[r] to ends[r]. The index
+    answers "which rows cover line N" in O(log n + k), and "where does row R
+    start" in O(1). Everything is stored in flat arrays, so building it costs a
+    sort and no per-line allocations, regardless of how many lines a row spans.
+
+    The rows are sorted by start line, and a max-heap shaped segment tree over the
+    sorted rows records the largest end line in each subtree. A query only visits
+    subtrees that start at or before N and that contain a row ending after N.
+
+    Any ordered int keys can stand for lines, e.g. (line, column) positions
+    packed into one int, with typecode "q" to hold them.
+    """
+
+    starts: Sequence[int]
+    ends: Sequence[int]
+
+    def __init__(
+        self,
+        starts: Sequence[int] | None = None,
+        ends: Sequence[int] | None = None,
+        typecode: str = "i",
+    ) -> None:
+        self.starts = starts if starts is not None else array(typecode)
+        self.ends = ends if ends is not None else array(typecode)
+        assert len(self.starts) == len(self.ends)
+
+        n = len(self.starts)
+        # Rows, by start line
+        self._order = array("i", sorted(range(n), key=self.starts.__getitem__))
+        self._sorted_starts = array(typecode, (self.starts[row] for row in self._order))
+        self._size = 1 << max(n - 1, 0).bit_length()
+        self._levels = self._size.bit_length() - 1
+        # Below any end
+        no_end = -(2 ** (8 * array(typecode).itemsize - 1))
+        max_end = array(typecode, [no_end]) * (2 * self._size)
+        for pos, row in enumerate(self._order):
+            max_end[self._size + pos] = self.ends[row]
+        for node in range(self._size - 1, 0, -1):
+            max_end[node] = max(max_end[2 * node], max_end[2 * node + 1])
+        self._max_end = max_end
+
+    @classmethod
+    def from_ranges(cls, ranges: Iterable[tuple[int, int]]) -> "IntervalIndex":
+        starts = array("i")
+        ends = array("i")
+        for start, end in ranges:
+            starts.append(start)
+            ends.append(end)
+        return cls(starts, ends)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def start(self, row: int) -> int:
+        """The first source line of a row"""
+        return self.starts[row]
+
+    def overlapping(self, line: int) -> list[int]:
+        """The rows covering line, in row order"""
+        return self.between(line, line)
+
+    def between(self, first: int, last: int) -> list[int]:
+        """The rows covering any line from first to last included, in row order"""
+        # Only rows at sorted positions below this start at or before last
+        limit = bisect_right(self._sorted_starts, last)
+        if not limit:
+            return []
+        size = self._size
+        levels = self._levels
+        max_end = self._max_end
+        order = self._order
+        result = []
+        stack = [1]
+        while stack:
+            node = stack.pop()
+            if max_end[node] <= first:
+                continue
+            if node >= size:
+                result.append(order[node - size])
+                continue
+            left = 2 * node
+            stack.append(left)
+            # The position of the first row under the right child
+            depth = left.bit_length() - 1
+            if ((left + 1) << (levels - depth)) - size < limit:
+                stack.append(left + 1)
+        result.sort()
+        return result
+
+    def innermost(self, line: int) -> list[int]:
+        """The shortest of the rows covering line, in row order"""
+        rows = self.overlapping(line)
+        if len(rows) <= 1:
+            return rows
+        starts = self.starts
+        ends = self.ends
+        shortest = min(ends[row] - starts[row] for row in rows)
+        return [row for row in rows if ends[row] - starts[row] == shortest]
+
+    def within(self, first: int, end: int) -> list[int]:
+        """
+        The rows whose non-empty ranges are inside the python-style range first
+        to end, in row order
+        """
+        # The rows starting in the range, at consecutive sorted positions
+        low = bisect_left(self._sorted_starts, first)
+        high = bisect_left(self._sorted_starts, end, low)
+        ends = self.ends
+        starts = self.starts
+        result = [
+            row for row in self._order[low:high] if starts[row] < ends[row] <= end
+        ]
+        result.sort()
+        return result
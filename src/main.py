@@ -1,9 +1,14 @@
 import argparse
 from pathlib import Path
 import importlib
+import os
 import sys
+import tracemalloc
 
-from viewer import CodeViewer
+from disk_cache import DiskCache
+from export import EXPORT_STAGES, export
+from pipeline import Pipeline
+from profiling import profiler
 
 
 def main(args: list[str]) -> None:
@@ -14,27 +19,183 @@ def main(args: list[str]) -> None:
     parser.add_argument("filename", nargs="?")
     parser.add_argument("-c", dest="command")
     parser.add_argument("-m", dest="module")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="after an edit, only recompute the top-level statements that changed",
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="edit the code beside the panels, updating them as you type",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=int,
+        default=300,
+        metavar="MS",
+        help="in live mode, milliseconds without typing before compiling (default: 300)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="reload the file, or the module's file, whenever it changes",
+    )
+    parser.add_argument(
+        "--export",
+        nargs="?",
+        const="-",
+        metavar="PATH",
+        help="write the details of each stage as NDJSON to PATH (default: stdout) "
+        "instead of starting the UI",
+    )
+    parser.add_argument(
+        "--stage",
+        action="append",
+        choices=list(EXPORT_STAGES),
+        help="with --export, the stage to export. Can be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--compare",
+        action="append",
+        metavar="PYTHON",
+        help="compile the code with the interpreter PYTHON too, and show the "
+        "instruction counts and code sizes of each function side by side instead "
+        "of starting the UI. Can be repeated",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="SOCKET",
+        help="answer pipeline queries on the Unix socket SOCKET until "
+        "interrupted, instead of starting the UI",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="when analyzing a directory or package, the number of worker "
+        "processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="don't keep the panels' contents on disk across runs",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="trace memory allocations, and on exit report the time and memory "
+        "peak of each step",
+    )
     parsed = parser.parse_args()
     # Check that at least 2 of the 3 options weren't entered
     if (parsed.filename, parsed.command, parsed.module).count(None) < 2:
         parser.error("Ambiguous arguments. Choose either a file, a module or a command")
+    if parsed.watch and parsed.filename is None and parsed.module is None:
+        parser.error("--watch needs a file or a module")
+
+    if parsed.profile:
+        tracemalloc.start()
 
+    if parsed.serve is not None:
+        # Only needed here
+        import asyncio
+        from server import serve
+
+        try:
+            asyncio.run(serve(Path(parsed.serve), Pipeline()))
+        except FileExistsError as e:
+            parser.error(str(e))
+        if parsed.profile:
+            print(profiler.report(), file=sys.stderr)
+        sys.exit(0)
+
+    # A directory or package is analyzed as a whole, without the UI
+    root = None
+    if parsed.filename and Path(parsed.filename).is_dir():
+        root = Path(parsed.filename)
+    elif parsed.module:
+        module = importlib.import_module(parsed.module)
+        if hasattr(module, "__path__") and module.__file__:
+            root = Path(module.__file__).parent
+    if root is not None:
+        # Only needed here, multiprocessing is slow to import
+        from project import analyze_project
+
+        if parsed.export in (None, "-"):
+            ok = analyze_project(root, sys.stdout, parsed.jobs)
+        else:
+            with open(parsed.export, "w") as output:
+                ok = analyze_project(root, output, parsed.jobs)
+        sys.exit(0 if ok else 1)
+
+    watch_path = None
     if parsed.filename:
-        code = Path(parsed.filename).read_text()
+        watch_path = Path(parsed.filename)
+        code = watch_path.read_text()
     elif parsed.command:
         code = parsed.command
     elif parsed.module:
         src_path = importlib.import_module(parsed.module).__file__
         if src_path:
-            code = Path(src_path).read_text()
+            watch_path = Path(src_path)
+            code = watch_path.read_text()
         else:
             raise ValueError(f"module {parsed.module} has no source")
     else:
         code = "# Enter code here"
 
+    if parsed.compare:
+        # Only needed here
+        from compare import compare, format_comparison, write_comparison
+
+        # This interpreter first, the others are compared with it
+        results = compare(
+            code, [sys.executable, *parsed.compare], parsed.filename or "<source>"
+        )
+        if parsed.export is None:
+            print(format_comparison(results))
+        elif parsed.export == "-":
+            write_comparison(results, sys.stdout)
+        else:
+            with open(parsed.export, "w") as output:
+                write_comparison(results, output)
+        sys.exit(0 if all(result.error is None for result in results) else 1)
+
+    if parsed.export is not None:
+        pipeline = Pipeline(filename=parsed.filename or "<source>")
+        stages = parsed.stage or EXPORT_STAGES
+        if parsed.export == "-":
+            try:
+                ok = export(code, sys.stdout, stages, pipeline)
+                sys.stdout.flush()
+            except BrokenPipeError:
+                # The reader went away, e.g. head: stop quietly. Python
+                # flushes stdout again on exit, so send that to devnull
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                sys.exit(1)
+        else:
+            with open(parsed.export, "w") as output:
+                ok = export(code, output, stages, pipeline)
+        if parsed.profile:
+            print(profiler.report(), file=sys.stderr)
+        sys.exit(0 if ok else 1)
+
+    # Only needed for the UI, importing Textual is slow
+    from viewer import CodeViewer
+
     app = CodeViewer()
     app.startup_code = code
+    app.pipeline.incremental = parsed.incremental
+    if not parsed.no_cache:
+        app.pipeline.disk_cache = DiskCache()
+    app.live = parsed.live
+    app.debounce = parsed.debounce / 1000
+    if parsed.watch:
+        app.watch_path = watch_path
     app.run()
+    if parsed.profile:
+        print(profiler.report())
 
 
 if __name__ == "__main__":
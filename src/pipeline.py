@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import io
+import math
+import sys
+import threading
+import tokenize
+from collections import Counter, OrderedDict
+from types import CodeType
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple, TypeVar
+
+# Conditional imports for 3.13
+VERSION_3_13 = sys.version_info >= (3, 13)
+
+if VERSION_3_13:
+    compiler_codegen: Any
+    optimize_cfg: Any
+    assemble_code_object: Any
+    from _testinternalcapi import compiler_codegen, optimize_cfg, assemble_code_object  # type: ignore
+else:
+
+    def _fail(*args: Any, **kwargs: Any) -> Any:
+        raise Exception("This function should never have been called")
+
+    compiler_codegen = optimize_cfg = assemble_code_object = _fail
+
+
+from profiling import profiler
+
+if TYPE_CHECKING:
+    from disk_cache import DiskCache
+
+T = TypeVar("T")
+
+# The optimization level of the generated bytecode
+OPTIMIZE = 0
+
+STAGES = ("tokens", "ast", "opt_ast", "pseudo_bc", "opt_bc", "code_obj")
+
+
+class PseudoBytecode(NamedTuple):
+    # The instruction sequence, as returned by compiler_codegen
+    seq: Any
+    # The instructions in the sequence, as tuples. See PseudoInstruction
+    instructions: list[Any]
+    metadata: dict[str, Any]
+    co_consts: list[object]
+
+
+class OptimizedBytecode(NamedTuple):
+    seq: Any
+    instructions: list[Any]
+    co_consts: list[object]
+
+
+def source_hash(code: str) -> str:
+    return hashlib.sha1(code.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class Pipeline:
+    """
+    The stages of the compiler pipeline:
+
+        source -> tokens -> AST -> optimized AST -> pseudo bytecode
+               -> optimized pseudo bytecode -> code object
+
+    Each stage is computed at most once per source revision, and shared by every
+    panel that needs it. The results of the last few revisions are kept, keyed by
+    the hash of the source.
+
+    Stages may be requested from worker threads. Computing a stage holds the
+    pipeline lock, so two workers never compute the same stage twice.
+    """
+
+    filename: str
+    max_revisions: int
+    # Whether panels should reuse the details of unchanged top-level statements
+    incremental: bool
+    # Where panels keep their details across runs, if anywhere
+    disk_cache: DiskCache | None
+    hits: Counter[str]
+    misses: Counter[str]
+
+    def __init__(
+        self,
+        filename: str = "<source>",
+        max_revisions: int = 4,
+        incremental: bool = False,
+        disk_cache: DiskCache | None = None,
+    ) -> None:
+        self.filename = filename
+        self.max_revisions = max_revisions
+        self.incremental = incremental
+        self.disk_cache = disk_cache
+        self.hits = Counter()
+        self.misses = Counter()
+        self._revisions: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._last_code: str | None = None
+        self._last_hash = ""
+        # Reentrant, as later stages request the earlier ones
+        self._lock = threading.RLock()
+
+    def source_hash(self, code: str) -> str:
+        # Panels ask for the same string object over and over; avoid rehashing it
+        if code is not self._last_code:
+            self._last_code = code
+            self._last_hash = source_hash(code)
+        return self._last_hash
+
+    def _stage(self, stage: str, code: str, compute: Callable[[str], T]) -> T:
+        with self._lock:
+            return self._compute_stage(stage, code, compute)
+
+    def _compute_stage(self, stage: str, code: str, compute: Callable[[str], T]) -> T:
+        key = self.source_hash(code)
+        results = self._revisions.get(key)
+        if results is None:
+            results = self._revisions[key] = {}
+            if len(self._revisions) > self.max_revisions:
+                self._revisions.popitem(last=False)
+        else:
+            self._revisions.move_to_end(key)
+        if stage in results:
+            self.hits[stage] += 1
+            return results[stage]  # type: ignore[no-any-return]
+        self.misses[stage] += 1
+        with profiler.measure(stage):
+            result = results[stage] = compute(code)
+        return result
+
+    def stats(self) -> dict[str, tuple[int, int]]:
+        """(hits, misses) for each stage"""
+        with self._lock:
+            return {stage: (self.hits[stage], self.misses[stage]) for stage in STAGES}
+
+    def check(self, code: str) -> None:
+        """
+        Raise SyntaxError if code doesn't compile.
+
+        This runs the stages that report every compile error, so that their
+        results are cached for the panels.
+        """
+        if VERSION_3_13:
+            self.pseudo_bytecode(code)
+        else:
+            self.code_object(code)
+
+    def tokens(self, code: str) -> list[tokenize.TokenInfo]:
+        return self._stage("tokens", code, _tokenize)
+
+    def tree(self, code: str) -> ast.Module:
+        return self._stage("ast", code, ast.parse)
+
+    def optimized_tree(self, code: str) -> ast.Module:
+        return self._stage(
+            "opt_ast", code, lambda code: ast.parse(code, optimize=True)  # type: ignore
+        )
+
+    def pseudo_bytecode(self, code: str) -> PseudoBytecode:
+        return self._stage("pseudo_bc", code, self._codegen)
+
+    def optimized_bytecode(self, code: str) -> OptimizedBytecode:
+        return self._stage("opt_bc", code, self._optimize)
+
+    def code_object(self, code: str) -> CodeType:
+        return self._stage("code_obj", code, self._assemble)
+
+    def _codegen(self, code: str) -> PseudoBytecode:
+        seq, metadata = compiler_codegen(
+            self.optimized_tree(code), self.filename, OPTIMIZE
+        )
+        consts = metadata["consts"]
+        co_consts = [_const_value(key) for key in sorted(consts, key=consts.get)]
+        # Snapshot the instructions now, later stages consume the sequence
+        return PseudoBytecode(seq, seq.get_instructions(), metadata, co_consts)
+
+    def _optimize(self, code: str) -> OptimizedBytecode:
+        pseudo = self.pseudo_bytecode(code)
+        # optimize_cfg may add new constants to the list it is given
+        co_consts = list(pseudo.co_consts)
+        nlocals = 0
+        seq = optimize_cfg(pseudo.seq, co_consts, nlocals)
+        return OptimizedBytecode(seq, seq.get_instructions(), co_consts)
+
+    def _assemble(self, code: str) -> CodeType:
+        if not VERSION_3_13:
+            return compile(code, self.filename, "exec")
+        optimized = self.optimized_bytecode(code)
+        metadata = dict(self.pseudo_bytecode(code).metadata)
+        metadata["consts"] = {
+            _const_key(value): i for i, value in enumerate(optimized.co_consts)
+        }
+        _complete_metadata(metadata, self.filename)
+        return assemble_code_object(self.filename, optimized.seq, metadata)  # type: ignore[no-any-return]
+
+
+# The fields assemble_code_object requires and codegen may leave out, as in
+# test.test_compiler_assemble, which imports unittest. Shared between calls,
+# assembling doesn't modify them
+_METADATA_DEFAULTS: dict[str, Any] = {
+    "name": "name",
+    "qualname": "qualname",
+    "consts": {},
+    "names": {},
+    "varnames": {},
+    "cellvars": {},
+    "freevars": {},
+    "fasthidden": {},
+    "argcount": 0,
+    "posonlyargcount": 0,
+    "kwonlyargcount": 0,
+    "firstlineno": 1,
+}
+
+
+def _complete_metadata(metadata: dict[str, Any], filename: str) -> None:
+    for key, value in _METADATA_DEFAULTS.items():
+        metadata.setdefault(key, value)
+    metadata.setdefault("filename", filename)
+
+
+def _const_value(key: Any) -> Any:
+    # Constants that compare equal but must stay distinct (False and 0, 0.0 and
+    # -0.0, ...) are keyed by the compiler with a tuple, holding the constant
+    # second. See _PyCode_ConstantKey
+    return key[1] if type(key) is tuple else key
+
+
+def _const_key(value: Any) -> Any:
+    """The inverse of _const_value, the key the compiler uses for a constant"""
+    if value is None or value is ... or type(value) in (int, str, CodeType):
+        return value
+    if type(value) in (bool, bytes):
+        return (type(value), value)
+    if type(value) is float:
+        return (float, value, math.copysign(1.0, value))
+    if type(value) is complex:
+        return (
+            complex,
+            value,
+            math.copysign(1.0, value.real),
+            math.copysign(1.0, value.imag),
+        )
+    if type(value) is tuple:
+        return (tuple(_const_key(v) for v in value), value)
+    if type(value) is frozenset:
+        return (frozenset(_const_key(v) for v in value), value)
+    return (id(value), value)
+
+
+def _tokenize(code: str) -> list[tokenize.TokenInfo]:
+    return list(tokenize.tokenize(io.BytesIO(code.encode("utf-8")).readline))
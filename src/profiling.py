@@ -0,0 +1,141 @@
+"""
+Wall time, CPU time and memory peak of each step of the pipeline and of the
+rendering.
+
+Timings are always recorded, they cost a couple of clock reads per step.
+Memory peaks are only recorded while tracemalloc is tracing (see --profile),
+as tracing slows everything down.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple
+
+
+class Measurement(NamedTuple):
+    # In seconds
+    wall: float
+    cpu: float
+    # The highest memory use above the start of the step, in bytes. None when
+    # tracemalloc isn't tracing
+    peak: int | None
+
+
+class _Frame:
+    def __init__(self) -> None:
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.thread_time()
+        self.children_wall = 0.0
+        self.children_cpu = 0.0
+        self.base = 0
+        self.peak = 0
+        self.reset_peak()
+
+    def reset_peak(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.base = tracemalloc.get_traced_memory()[0]
+
+    def record_peak(self) -> None:
+        if tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - self.base)
+
+
+class Profiler:
+    """
+    Measurements of named steps.
+
+    Measurements are exclusive: when steps are nested, e.g. a stage computing the
+    stages it depends on, the time spent in the inner steps is not counted in
+    the outer one. CPU time is per thread. tracemalloc is process wide, so the
+    memory peak of a step includes what other threads allocate meanwhile.
+    """
+
+    # The last measurement of each step
+    last: dict[str, Measurement]
+    # The number of measurements and their sums (max for the peak), by step
+    totals: dict[str, tuple[int, Measurement]]
+
+    def __init__(self) -> None:
+        self.last = {}
+        self.totals = {}
+        self._lock = threading.Lock()
+        # The steps being measured in each thread, innermost last
+        self._local = threading.local()
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        stack: list[_Frame] = self._local.__dict__.setdefault("stack", [])
+        if stack:
+            stack[-1].record_peak()
+        frame = _Frame()
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            frame.record_peak()
+            wall = time.perf_counter() - frame.start_wall
+            cpu = time.thread_time() - frame.start_cpu
+            stack.pop()
+            if stack:
+                parent = stack[-1]
+                parent.children_wall += wall
+                parent.children_cpu += cpu
+                parent.reset_peak()
+            self.add(
+                name,
+                Measurement(
+                    wall - frame.children_wall,
+                    cpu - frame.children_cpu,
+                    frame.peak if tracemalloc.is_tracing() else None,
+                ),
+            )
+
+    def add(self, name: str, measurement: Measurement) -> None:
+        with self._lock:
+            self.last[name] = measurement
+            count, total = self.totals.get(name, (0, Measurement(0.0, 0.0, None)))
+            peak = total.peak
+            if measurement.peak is not None:
+                peak = max(peak or 0, measurement.peak)
+            self.totals[name] = (
+                count + 1,
+                Measurement(
+                    total.wall + measurement.wall, total.cpu + measurement.cpu, peak
+                ),
+            )
+
+    def report(self) -> str:
+        """A table of the totals of each step"""
+        with self._lock:
+            totals = dict(self.totals)
+        width = max((len(name) for name in totals), default=4)
+        lines = [
+            f"{'step':{width}} {'calls':>7} {'wall ms':>10} {'cpu ms':>10} {'peak KiB':>10}"
+        ]
+        for name, (count, total) in totals.items():
+            peak = (
+                f"{total.peak / 1024:10.1f}"
+                if total.peak is not None
+                else " " * 9 + "-"
+            )
+            lines.append(
+                f"{name:{width}} {count:7d} {total.wall * 1000:10.2f} "
+                f"{total.cpu * 1000:10.2f} {peak}"
+            )
+        return "\n".join(lines)
+
+
+def format_measurement(measurement: Measurement) -> str:
+    text = f"{measurement.wall * 1000:.1f} ms"
+    if measurement.peak is not None:
+        text += f" {measurement.peak / 1024:.0f} KiB"
+    return text
+
+
+# Shared by the pipeline and the panels
+profiler = Profiler()
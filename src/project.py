@@ -0,0 +1,256 @@
+"""
+Whole-project analysis: run the full pipeline on every file of a source tree,
+in a pool of processes.
+
+Each file produces one JSON record, written as soon as it is done and then
+dropped, so memory doesn't grow with the size of the tree:
+
+    {"file": "pkg/mod.py", "lines": 120, "tokens": 815, "instructions": 301,
+     "code_bytes": 980, "consts": 42, "opcodes": {"LOAD_CONST": 50, ...},
+     "functions": [
+        {"name": "<module>", "line": 1, "instructions": 40, "code_bytes": 124,
+         "consts": 12, "opcodes": {...}}, ...], "seconds": 0.012}
+
+Files that fail to compile get {"file": ..., "error": ...} instead. A final
+{"summary": ...} record has the totals, the opcode histogram of the whole tree
+and the throughput.
+"""
+
+from __future__ import annotations
+
+import dis
+import json
+import os
+import sys
+import time
+import tokenize
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from types import CodeType
+from typing import Any, Iterator, TextIO
+
+from pipeline import VERSION_3_13, Pipeline
+
+# Files submitted per worker ahead of the results, to keep the workers busy
+# without queueing the whole tree
+WINDOW_PER_WORKER = 4
+# A file is given up on after crashing the pool this many times
+MAX_ATTEMPTS = 2
+
+
+def iter_sources(root: Path) -> Iterator[Path]:
+    """The python files under root, in a stable order, skipping hidden dirs"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if not d.startswith(".") and d != "__pycache__"
+        )
+        for name in sorted(filenames):
+            if name.endswith(".py"):
+                yield Path(dirpath, name)
+
+
+def _code_objects(code: CodeType) -> Iterator[CodeType]:
+    stack = [code]
+    while stack:
+        co = stack.pop()
+        yield co
+        stack.extend(reversed([c for c in co.co_consts if isinstance(c, CodeType)]))
+
+
+def analyze_file(path: Path, root: Path) -> dict[str, Any]:
+    """Run the whole pipeline on a file. Runs in a worker process"""
+    started = time.perf_counter()
+    name = str(path.relative_to(root))
+    try:
+        with tokenize.open(path) as f:
+            code = f.read()
+        result = {"file": name, **analyze_code(code, str(path))}
+    except Exception as e:
+        return {"file": name, "error": f"{type(e).__name__}: {e}"}
+    result["seconds"] = round(time.perf_counter() - started, 6)
+    return result
+
+
+def analyze_code(code: str, filename: str = "<source>") -> dict[str, Any]:
+    """
+    The sizes of code at each stage of the pipeline, and those of each of its
+    functions. Raises the error of the first stage that fails.
+    """
+    pipeline = Pipeline(filename=filename, max_revisions=1)
+    result: dict[str, Any] = {
+        "lines": len(code.splitlines()),
+        "tokens": len(pipeline.tokens(code)),
+    }
+    pipeline.tree(code)
+    if VERSION_3_13:
+        # Module level code only, nested functions are separate units
+        result["pseudo_instructions"] = len(pipeline.pseudo_bytecode(code).instructions)
+        result["optimized_instructions"] = len(
+            pipeline.optimized_bytecode(code).instructions
+        )
+    module = pipeline.code_object(code)
+
+    instructions = 0
+    code_bytes = 0
+    consts = 0
+    opcodes: Counter[str] = Counter()
+    functions = []
+    for co in _code_objects(module):
+        counts = Counter(i.opname for i in dis.get_instructions(co))
+        total = sum(counts.values())
+        functions.append(
+            {
+                # Assembled modules get the placeholder name of _METADATA_DEFAULTS
+                "name": (
+                    "<module>"
+                    if co is module
+                    else getattr(co, "co_qualname", co.co_name)
+                ),
+                "line": co.co_firstlineno,
+                "instructions": total,
+                "code_bytes": len(co.co_code),
+                "consts": len(co.co_consts),
+                "opcodes": dict(counts),
+            }
+        )
+        instructions += total
+        code_bytes += len(co.co_code)
+        consts += len(co.co_consts)
+        opcodes.update(counts)
+    result["instructions"] = instructions
+    result["code_bytes"] = code_bytes
+    result["consts"] = consts
+    result["opcodes"] = dict(opcodes)
+    result["functions"] = functions
+    return result
+
+
+class _Summary:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.files = 0
+        self.errors = 0
+        self.lines = 0
+        self.functions = 0
+        self.instructions = 0
+        self.consts = 0
+        self.opcodes: Counter[str] = Counter()
+
+    def add(self, result: dict[str, Any]) -> None:
+        self.files += 1
+        if "error" in result:
+            self.errors += 1
+            return
+        self.lines += result["lines"]
+        self.functions += len(result["functions"])
+        self.instructions += result["instructions"]
+        self.consts += result["consts"]
+        self.opcodes.update(result["opcodes"])
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def progress(self) -> str:
+        elapsed = self.elapsed()
+        return f"{self.files} files, {self.files / elapsed:.1f} files/s"
+
+    def record(self, jobs: int) -> dict[str, Any]:
+        elapsed = self.elapsed()
+        return {
+            "summary": {
+                "files": self.files,
+                "errors": self.errors,
+                "lines": self.lines,
+                "functions": self.functions,
+                "instructions": self.instructions,
+                "consts": self.consts,
+                "opcodes": dict(self.opcodes.most_common()),
+                "jobs": jobs,
+                "seconds": round(elapsed, 3),
+                "files_per_second": round(self.files / elapsed, 1),
+                "lines_per_second": round(self.lines / elapsed),
+            }
+        }
+
+
+def analyze_project(root: Path, output: TextIO, jobs: int | None = None) -> bool:
+    """
+    Analyze every python file under root, writing one JSON record per file to
+    output as they complete, then a summary.
+
+    At most WINDOW_PER_WORKER files per worker are in flight, so neither the
+    file list nor the results are ever held in full. If a file crashes its
+    worker, the pool is restarted and the files that were in flight are retried
+    one at a time; a file that crashes on its own is reported as an error.
+
+    Returns False if any file failed.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    summary = _Summary()
+    show_progress = sys.stderr.isatty()
+    last_progress = 0.0
+
+    def write(record: dict[str, Any]) -> None:
+        output.write(json.dumps(record))
+        output.write("\n")
+
+    sources = iter_sources(root)
+    # future -> (path, attempt)
+    pending: dict[Future[dict[str, Any]], tuple[Path, int]] = {}
+    # Files in flight when the pool broke
+    retries: list[tuple[Path, int]] = []
+    executor = ProcessPoolExecutor(jobs)
+    try:
+        while True:
+            if retries:
+                # One at a time, so that a crash can only come from that file
+                if not pending:
+                    path, attempt = retries.pop()
+                    pending[executor.submit(analyze_file, path, root)] = (path, attempt)
+            else:
+                while len(pending) < jobs * WINDOW_PER_WORKER:
+                    path = next(sources, None)  # type: ignore[assignment]
+                    if path is None:
+                        break
+                    pending[executor.submit(analyze_file, path, root)] = (path, 1)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    continue
+                pending.pop(future)
+                summary.add(result)
+                write(result)
+
+            if broken:
+                # Every future left belongs to the dead pool
+                for path, attempt in pending.values():
+                    if attempt < MAX_ATTEMPTS:
+                        retries.append((path, attempt + 1))
+                    else:
+                        result = {
+                            "file": str(path.relative_to(root)),
+                            "error": "the worker process crashed",
+                        }
+                        summary.add(result)
+                        write(result)
+                pending.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(jobs)
+
+            if show_progress and summary.elapsed() - last_progress >= 1:
+                last_progress = summary.elapsed()
+                print(summary.progress(), end="\r", file=sys.stderr)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    write(summary.record(jobs))
+    return summary.errors == 0
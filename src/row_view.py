@@ -0,0 +1,147 @@
+from typing import Any, Iterable, Sequence
+
+from rich.segment import Segment
+from rich.syntax import DEFAULT_THEME, Syntax
+from rich.text import Text
+from textual.cache import LRUCache
+from textual.geometry import Region, Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+from profiling import profiler
+from styles import HEAT, HIGHLIGHT, MATCH
+
+
+class RowView(ScrollView):
+    """
+    A scrollable list of syntax highlighted rows, some of which may be highlighted,
+    some marked as matching a search, and some tinted by how often they ran.
+
+    Rows are rendered lazily, as they are scrolled into view, and cached. Changing
+    the highlighted, marked or tinted rows only redraws the rows whose state
+    changed.
+    """
+
+    # The text of each row
+    rows: Sequence[str]
+    # Set while the view shows a message instead of rows
+    _message: Text | None = None
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.rows = []
+        self._highlighted_rows: set[int] = set()
+        self._marked_rows: set[int] = set()
+        # The heat level of the rows that ran, from 1 to len(HEAT)
+        self._heat_rows: dict[int, int] = {}
+        # Rendered rows, before cropping to the viewport. Keyed by (row,
+        # highlighted, marked, heat level)
+        self._row_cache: LRUCache[tuple[int, bool, bool, int], Strip] = LRUCache(1024)
+        self._syntax = Syntax("", "python", word_wrap=False)
+        self._background = Syntax.get_theme(DEFAULT_THEME).get_background_style()
+
+    def set_rows(self, rows: Sequence[str], width: int) -> None:
+        self._message = None
+        self._set_rows(rows, width)
+
+    def show_message(self, message: str | Text) -> None:
+        """Replace the rows with a message, e.g. while they are computed"""
+        self._message = Text(message) if isinstance(message, str) else message
+        self._set_rows([self._message.plain], self._message.cell_len)
+
+    def _set_rows(self, rows: Sequence[str], width: int) -> None:
+        self.rows = rows
+        self._highlighted_rows = set()
+        self._marked_rows = set()
+        self._heat_rows = {}
+        self._row_cache.clear()
+        self.virtual_size = Size(width, len(rows))
+        self.refresh()
+
+    def row_at(self, y: int) -> int:
+        """The row shown at offset y of the widget"""
+        return self.scroll_offset.y + y
+
+    def highlight_text(self, row: int) -> Text:
+        """The syntax highlighted text of a row"""
+        text = self._syntax.highlight(self.rows[row])
+        text.remove_suffix("\n")
+        return text
+
+    def render_row(self, row: int, highlighted: bool) -> Strip:
+        if self._message is not None:
+            return Strip(self._message.render(self.app.console))
+        strip = Strip(self.highlight_text(row).render(self.app.console))
+        if highlighted:
+            strip = Strip(Segment.apply_style(strip, post_style=HIGHLIGHT))
+        return strip
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, _ = self.scroll_offset
+        row = self.row_at(y)
+        width = self.size.width
+        style = self.rich_style if self._message is not None else self._background
+        if row >= len(self.rows):
+            return Strip.blank(width, style)
+
+        highlighted = row in self._highlighted_rows
+        # The highlight shows over the mark, and the mark over the heat
+        marked = not highlighted and row in self._marked_rows
+        heat = 0 if highlighted or marked else self._heat_rows.get(row, 0)
+        key = (row, highlighted, marked, heat)
+        strip = self._row_cache.get(key)
+        if strip is None:
+            with profiler.measure("render"):
+                strip = self.render_row(row, highlighted)
+                if marked:
+                    strip = Strip(Segment.apply_style(strip, post_style=MATCH))
+                elif heat:
+                    strip = Strip(Segment.apply_style(strip, post_style=HEAT[heat - 1]))
+                self._row_cache[key] = strip
+        if highlighted:
+            style += HIGHLIGHT
+        elif marked:
+            style += MATCH
+        elif heat:
+            style += HEAT[heat - 1]
+        return strip.crop_extend(scroll_x, scroll_x + width, style)
+
+    def highlight_rows(self, rows: set[int]) -> None:
+        """Highlight the given rows, redrawing only those that changed"""
+        changed = rows ^ self._highlighted_rows
+        self._highlighted_rows = rows
+        self._refresh_rows(changed)
+
+    def mark_rows(self, rows: set[int]) -> None:
+        """Mark the given rows as matching, redrawing only those that changed"""
+        changed = rows ^ self._marked_rows
+        self._marked_rows = rows
+        self._refresh_rows(changed)
+
+    def heat_rows(self, rows: dict[int, int]) -> None:
+        """Tint rows by heat level, redrawing only those that changed"""
+        changed = {
+            row
+            for row in rows.keys() | self._heat_rows.keys()
+            if rows.get(row) != self._heat_rows.get(row)
+        }
+        self._heat_rows = rows
+        self._refresh_rows(changed)
+
+    def restyle_rows(self, rows: Iterable[int]) -> None:
+        """Render rows again, after the styles of their text changed"""
+        rows = set(rows)
+        for key in [key for key in self._row_cache.keys() if key[0] in rows]:
+            self._row_cache.discard(key)
+        self._refresh_rows(rows)
+
+    def _refresh_rows(self, changed: set[int]) -> None:
+        top = self.scroll_offset.y
+        bottom = top + self.size.height
+        for row in changed:
+            if top <= row < bottom:
+                self.refresh_line(row)
+
+    def scroll_to_rows(self, first: int, last: int) -> None:
+        """Ensure rows first to last (inclusive) are visible"""
+        self.scroll_to_region(Region(0, first, 1, last - first + 1))
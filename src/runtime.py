@@ -0,0 +1,260 @@
+"""
+Running the code to find its hot paths: how often each line and instruction
+ran, and how the interpreter specialized the instructions while running them.
+
+The code runs in a separate, isolated interpreter, with limits on its CPU time,
+memory and file writes, in an empty temporary directory. This module is also
+the script that interpreter runs, so it only imports the standard library.
+
+Counts are sampled with sys.monitoring (Python 3.12+): the callback of an
+instruction counts it, then disables itself there until the next sample
+period, when all the events are restarted. Each instruction costs at most one
+call per period however often it runs, so the code runs at close to full
+speed. The count of an instruction is the number of periods in which it ran,
+and that of a line the count of its most sampled instruction.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from types import CodeType
+from typing import Iterator, NamedTuple
+
+# Whether the interpreter can count lines and instructions
+SUPPORTED = sys.version_info >= (3, 12)
+
+# The name the code is compiled with, as in the pipeline
+FILENAME = "<source>"
+# Seconds between samples
+SAMPLE_INTERVAL = 0.001
+# The limits of a run, in seconds and bytes
+RUN_TIMEOUT = 10.0
+MEMORY_LIMIT = 2 * 1024**3
+
+# Written before the profile, as the code may write to stdout too
+MARKER = "\n-- codoscope profile --\n"
+
+# A nested code object, as the indices among the code objects in the constants
+# of each code object from the module down
+CodePath = tuple[int, ...]
+
+
+class RunError(Exception):
+    pass
+
+
+class RuntimeProfile(NamedTuple):
+    # The code that ran
+    code: str
+    # The number of samples of the most sampled instruction of each line
+    lines: dict[int, int]
+    # The number of samples each instruction ran in, by offset, by code object
+    instructions: dict[CodePath, dict[int, int]]
+    # The specialized name of the instructions the interpreter specialized,
+    # by offset, by code object
+    specialized: dict[CodePath, dict[int, str]]
+    # The wall time of the run
+    seconds: float
+    # How the code stopped, if not by finishing
+    error: str | None
+
+    def line_heat(self, levels: int) -> dict[int, int]:
+        """A level from 1 to levels for each line that ran, on a log scale"""
+        top = math.log1p(max(self.lines.values(), default=0))
+        return {
+            line: 1 + int((levels - 1) * math.log1p(count) / top)
+            for line, count in self.lines.items()
+        }
+
+    def summary(self) -> str:
+        parts = [f"ran {self.seconds:.2f} s"]
+        if self.lines:
+            hottest = max(self.lines, key=self.lines.__getitem__)
+            parts.append(f"hottest line {hottest} ({self.lines[hottest]} samples)")
+        if self.error is not None:
+            parts.append(self.error)
+        return ", ".join(parts)
+
+
+def code_objects(
+    co: CodeType, path: CodePath = ()
+) -> Iterator[tuple[CodePath, CodeType]]:
+    """co and the code objects nested in it, depth first, with their paths"""
+    yield path, co
+    codes = [c for c in co.co_consts if isinstance(c, CodeType)]
+    for i, nested in enumerate(codes):
+        yield from code_objects(nested, (*path, i))
+
+
+def run_profile(code: str, timeout: float = RUN_TIMEOUT) -> RuntimeProfile:
+    """
+    Run code in a separate interpreter, and return how often each of its lines
+    and instructions ran. Raises RunError if it could not run at all.
+
+    The run is stopped after timeout seconds, with the counts so far.
+    """
+    if not SUPPORTED:
+        raise RunError("counting lines and instructions needs Python 3.12")
+    with tempfile.TemporaryDirectory(prefix="codoscope-") as directory:
+        try:
+            result = subprocess.run(
+                [sys.executable, "-I", "-B", __file__, str(timeout)],
+                input=code,
+                capture_output=True,
+                text=True,
+                cwd=directory,
+                env={},
+                # The run stops itself after timeout, this is for when it
+                # doesn't, e.g. stuck in C code
+                timeout=timeout + 5,
+            )
+        except subprocess.TimeoutExpired:
+            raise RunError(f"still running after {timeout + 5:g} s, killed")
+    _, marker, profile = result.stdout.rpartition(MARKER)
+    if not marker:
+        errors = result.stderr.strip().splitlines()
+        raise RunError(errors[-1] if errors else f"exit status {result.returncode}")
+    data = json.loads(profile)
+    instructions: dict[CodePath, dict[int, int]] = {}
+    for path, offset, count in data["instructions"]:
+        instructions.setdefault(tuple(path), {})[offset] = count
+    specialized: dict[CodePath, dict[int, str]] = {}
+    for path, offset, opname in data["specialized"]:
+        specialized.setdefault(tuple(path), {})[offset] = opname
+    return RuntimeProfile(
+        code,
+        {line: count for line, count in data["lines"]},
+        instructions,
+        specialized,
+        data["seconds"],
+        data["error"],
+    )
+
+
+def _limit_resources(timeout: float) -> None:
+    try:
+        import resource
+    except ImportError:
+        return  # Not on this platform, only the timeout applies
+    limits = [
+        (resource.RLIMIT_CPU, math.ceil(timeout) + 1),
+        (resource.RLIMIT_AS, MEMORY_LIMIT),
+        # No writing to files, pipes are not limited
+        (resource.RLIMIT_FSIZE, 0),
+    ]
+    for limit, value in limits:
+        _, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+
+
+def _run(timeout: float) -> None:
+    """Run the code read from stdin, and write its profile to stdout"""
+    import dis
+
+    _limit_resources(timeout)
+    # A SyntaxError is reported on stderr
+    module = compile(sys.stdin.read(), FILENAME, "exec")
+    stdout = sys.stdout
+    # The output of the code is thrown away
+    sys.stdout = sys.stderr = io.StringIO()
+    sys.stdin = io.StringIO()
+    paths = {co: path for path, co in code_objects(module)}
+    instructions: Counter[tuple[CodePath, int]] = Counter()
+
+    monitoring = sys.monitoring  # type: ignore[attr-defined]
+    tool = monitoring.PROFILER_ID
+    events = monitoring.events
+    disable = monitoring.DISABLE
+
+    def on_instruction(co: CodeType, offset: int) -> object:
+        instructions[paths[co], offset] += 1
+        return disable
+
+    monitoring.use_tool_id(tool, "codoscope")
+    # Line events are not used: disabling one at an instruction also
+    # disables its instruction event
+    monitoring.register_callback(tool, events.INSTRUCTION, on_instruction)
+    # Only the code itself, not what it calls in other modules
+    for co in paths:
+        monitoring.set_local_events(tool, co, events.INSTRUCTION)
+
+    done = threading.Event()
+    stopped = False
+
+    def sample() -> None:
+        nonlocal stopped
+        deadline = time.monotonic() + timeout
+        while not done.wait(SAMPLE_INTERVAL):
+            monitoring.restart_events()
+            if time.monotonic() > deadline:
+                stopped = True
+                # Raises KeyboardInterrupt in the code
+                import _thread
+
+                _thread.interrupt_main()
+                return
+
+    # Otherwise the sampler only gets to run every 5 ms
+    sys.setswitchinterval(SAMPLE_INTERVAL)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    error = None
+    started = time.perf_counter()
+    try:
+        exec(module, {"__name__": "__main__", "__builtins__": __builtins__})
+    except KeyboardInterrupt:
+        error = f"stopped after {timeout:g} s" if stopped else "KeyboardInterrupt"
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    for co in paths:
+        monitoring.set_local_events(tool, co, 0)
+    monitoring.free_tool_id(tool)
+
+    lines: dict[int, int] = {}
+    specialized = []
+    for co, path in paths.items():
+        static = list(dis.get_instructions(co))
+        for instruction in static:
+            count = instructions.get((path, instruction.offset), 0)
+            line = instruction.positions and instruction.positions.lineno
+            if count and line and count > lines.get(line, 0):
+                lines[line] = count
+        adaptive = dis.get_instructions(co, adaptive=True)
+        for instruction, specialized_instruction in zip(static, adaptive):
+            opname = specialized_instruction.opname
+            if opname != instruction.opname:
+                specialized.append((path, instruction.offset, opname))
+    profile = {
+        "lines": list(lines.items()),
+        "instructions": [
+            (path, offset, count) for (path, offset), count in instructions.items()
+        ],
+        "specialized": specialized,
+        "seconds": seconds,
+        "error": error,
+    }
+    stdout.write(MARKER + json.dumps(profile))
+    stdout.flush()
+    # Skip the code's atexit handlers and threads
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    _run(float(sys.argv[1]))
@@ -0,0 +1,17 @@
+from textual.binding import Binding
+from textual.message import Message
+from textual.widgets import Input
+
+
+class SearchBar(Input):
+    """
+    The search box. Enter goes to the next match, escape closes it.
+    """
+
+    BINDINGS = [Binding("escape", "close", "Close search")]
+
+    class Closed(Message):
+        pass
+
+    def action_close(self) -> None:
+        self.post_message(self.Closed())
@@ -0,0 +1,101 @@
+"""
+Searching the rows of a panel, through an inverted index of the words in them.
+"""
+
+from __future__ import annotations
+
+import re
+from array import array
+from bisect import bisect_left
+
+from detail_store import DetailStore
+
+# Opcode names, AST node and field names, identifiers and numbers are all words
+WORD = re.compile(r"\w+")
+
+
+class Query:
+    """
+    The words a row must contain, in any order, case insensitively.
+
+    A word ending with * matches every word starting with it, e.g. LOAD_* matches
+    LOAD_CONST and LOAD_GLOBAL.
+    """
+
+    text: str
+    words: list[str]
+    prefixes: list[str]
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.words = []
+        self.prefixes = []
+        for part in text.lower().split():
+            words = WORD.findall(part)
+            if words and part.endswith("*"):
+                self.prefixes.append(words.pop())
+            self.words.extend(words)
+
+    def __bool__(self) -> bool:
+        return bool(self.words or self.prefixes)
+
+
+class SearchIndex:
+    """
+    The rows of a DetailStore containing each word, lowercased.
+
+    Building the index costs a pass of the regex over the text column. A query
+    then costs a lookup per word, or a binary search of the sorted words per
+    prefix, and the intersection of the rows found.
+    """
+
+    store: DetailStore
+
+    def __init__(self, store: DetailStore) -> None:
+        self.store = store
+        text, offsets, _, _ = store.columns()
+        postings: dict[str, array] = {}
+        row = 0
+        for match in WORD.finditer(text):
+            # Matches come in order, so the row only moves forward
+            while offsets[row + 1] <= match.start():
+                row += 1
+            word = match.group().lower()
+            rows = postings.get(word)
+            if rows is None:
+                postings[word] = array("i", [row])
+            elif rows[-1] != row:
+                rows.append(row)
+        self._postings = postings
+        self._words = sorted(postings)
+
+    def _prefix_rows(self, prefix: str) -> set[int]:
+        rows: set[int] = set()
+        i = bisect_left(self._words, prefix)
+        while i < len(self._words) and self._words[i].startswith(prefix):
+            rows.update(self._postings[self._words[i]])
+            i += 1
+        return rows
+
+    def search(self, query: Query) -> list[int]:
+        """The rows matching query, in order"""
+        if not query:
+            return []
+        empty = array("i")
+        # The rarest words first, to keep the intersection small
+        postings = sorted(
+            (self._postings.get(word, empty) for word in query.words), key=len
+        )
+        prefixes = query.prefixes
+        if postings:
+            result = set(postings[0])
+            for rows in postings[1:]:
+                result.intersection_update(rows)
+        else:
+            result = self._prefix_rows(prefixes[0])
+            prefixes = prefixes[1:]
+        for prefix in prefixes:
+            if not result:
+                break
+            result &= self._prefix_rows(prefix)
+        return sorted(result)
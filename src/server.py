@@ -0,0 +1,233 @@
+"""
+A long-lived server answering pipeline queries over a Unix socket, so that
+editor plugins and scripts don't pay for starting an interpreter and compiling
+cold for every file.
+
+Requests and responses are NDJSON. A request is one line:
+
+    {"id": 1, "code": "x = 1", "stages": ["ast", "code_obj"], "lines": [1, 10]}
+
+"stages" defaults to every stage of --export, and "lines", a range of source
+lines including both ends, to every row. The rows of each stage are streamed
+back as the records of --export, with the id of the request, and a last record
+tells whether every stage succeeded:
+
+    {"id": 1, "stage": "ast", "text": "Module()", "start_line": 0, "end_line": 1}
+    {"id": 1, "done": true, "ok": true}
+
+A request that can't be read is answered with an "error" in its last record.
+One longer than MAX_REQUEST also closes the connection, as the rest of it
+can't be skipped. The requests of a connection are answered in order, those of
+different connections concurrently.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import signal
+import socket
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable
+
+from detail_store import DetailStore
+from export import EXPORT_STAGES
+from interval_index import IntervalIndex
+from pipeline import Pipeline, source_hash
+
+# The number of stages whose details are kept, for any source
+MAX_RESULTS = 64
+# The longest request line, in bytes
+MAX_REQUEST = 64 * 1024 * 1024
+# Rows written before waiting for the client to read them
+CHUNK_ROWS = 512
+
+
+class RequestError(Exception):
+    pass
+
+
+class ResultCache:
+    """
+    The details of the last stages served, with an index of their lines, by
+    source hash and stage. Shared by the worker threads computing them.
+    """
+
+    pipeline: Pipeline
+    max_results: int
+
+    def __init__(self, pipeline: Pipeline, max_results: int = MAX_RESULTS) -> None:
+        self.pipeline = pipeline
+        self.max_results = max_results
+        self._results: OrderedDict[
+            tuple[str, str], tuple[DetailStore, IntervalIndex]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, code: str, stage: str) -> tuple[DetailStore, IntervalIndex]:
+        key = (source_hash(code), stage)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                return result
+        # Not holding the lock, so that other stages and sources are served
+        # meanwhile. The pipeline computes each of its stages once
+        store = DetailStore.from_details(EXPORT_STAGES[stage](self.pipeline, code))
+        result = (store, IntervalIndex(store.starts, store.ends))
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return result
+
+
+def parse_request(
+    request: dict[str, Any],
+) -> tuple[str, list[str], tuple[int, int] | None]:
+    """The code, stages and line range of a request"""
+    code = request.get("code")
+    if not isinstance(code, str):
+        raise RequestError('"code" must be a string')
+    stages = request.get("stages", list(EXPORT_STAGES))
+    if not isinstance(stages, list) or not all(
+        stage in EXPORT_STAGES for stage in stages
+    ):
+        raise RequestError(f'"stages" must be a list of {", ".join(EXPORT_STAGES)}')
+    lines = request.get("lines")
+    if lines is not None:
+        if not (
+            isinstance(lines, list)
+            and len(lines) == 2
+            and all(type(line) is int for line in lines)
+            and lines[0] <= lines[1]
+        ):
+            raise RequestError('"lines" must be [first, last]')
+        lines = (lines[0], lines[1])
+    return code, stages, lines
+
+
+class Server:
+    """Answers the requests of each connection, computing stages in threads"""
+
+    cache: ResultCache
+
+    def __init__(self, pipeline: Pipeline) -> None:
+        self.cache = ResultCache(pipeline)
+        # The connections open, closed when the server stops
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    error = f"a request must be at most {MAX_REQUEST} bytes"
+                    _write(
+                        writer,
+                        [{"id": None, "error": error, "done": True, "ok": False}],
+                    )
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    await self.answer(line, writer)
+        except ConnectionError:
+            pass  # The client went away
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def close_connections(self) -> None:
+        """Close every open connection, idle clients would keep serve waiting"""
+        for writer in self._writers:
+            writer.close()
+
+    async def answer(self, line: bytes, writer: asyncio.StreamWriter) -> None:
+        id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("a request must be a JSON object")
+            id = request.get("id")
+            code, stages, lines = parse_request(request)
+        except (ValueError, RequestError) as e:
+            _write(writer, [{"id": id, "error": str(e), "done": True, "ok": False}])
+            await writer.drain()
+            return
+        ok = True
+        for stage in stages:
+            try:
+                store, index = await asyncio.to_thread(self.cache.get, code, stage)
+            except Exception as e:
+                ok = False
+                error = f"{type(e).__name__}: {e}"
+                _write(writer, [{"id": id, "stage": stage, "error": error}])
+                continue
+            rows: list[int] | range = (
+                range(len(store)) if lines is None else index.between(*lines)
+            )
+            for chunk in range(0, len(rows), CHUNK_ROWS):
+                _write(
+                    writer,
+                    (
+                        {
+                            "id": id,
+                            "stage": stage,
+                            "text": store[row],
+                            "start_line": store.start(row),
+                            "end_line": store.end(row),
+                        }
+                        for row in rows[chunk : chunk + CHUNK_ROWS]
+                    ),
+                )
+                await writer.drain()
+        _write(writer, [{"id": id, "done": True, "ok": ok}])
+        await writer.drain()
+
+
+_dumps = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def _write(writer: asyncio.StreamWriter, records: Iterable[dict[str, Any]]) -> None:
+    writer.write("".join(_dumps(record) + "\n" for record in records).encode())
+
+
+def _remove_stale_socket(path: Path) -> None:
+    """Remove the socket of a server that is gone, refuse to replace a live one"""
+    if not path.is_socket():
+        return
+    with socket.socket(socket.AF_UNIX) as probe:
+        try:
+            probe.connect(str(path))
+        except ConnectionRefusedError:
+            path.unlink()
+            return
+    raise FileExistsError(f"{path} is the socket of a running server")
+
+
+async def serve(path: Path, pipeline: Pipeline) -> None:
+    """Answer requests on the Unix socket at path until interrupted"""
+    _remove_stale_socket(path)
+    handler = Server(pipeline)
+    server = await asyncio.start_unix_server(handler.handle, path, limit=MAX_REQUEST)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    print(f"serving on {path}", file=sys.stderr, flush=True)
+    try:
+        async with server:
+            await stop.wait()
+            # Leaving waits for every connection to close
+            handler.close_connections()
+    finally:
+        path.unlink(missing_ok=True)
@@ -1,41 +1,123 @@
-from rich.syntax import Syntax
+from rich.containers import Lines
+from rich.segment import Segment
+from rich.style import Style
+from rich.syntax import DEFAULT_THEME, Syntax
+from rich.text import Text
+
+# Installed with rich, whose themes are only keyed by pygments token types.
+# pygments ships no type hints
+from pygments.token import Comment  # type: ignore[import-untyped]
 
-from textual.app import ComposeResult
 from textual import events
-from textual.containers import Container, VerticalScroll
-from textual.geometry import Region
-from textual.widgets import Static
-from styles import HIGHLIGHT
+from textual.strip import Strip
 
+from details import Span, byte_column, char_column
 from events import HoverLine
+from row_view import RowView
+from styles import HIGHLIGHT_SPAN
+
 
+class SourceWidget(RowView):
+    """
+    Display the source code, with line numbers.
 
-class SourceWidget(Container):
+    The whole source is syntax highlighted once, on first paint, so that
+    multi-line strings are highlighted correctly. Each row is then rendered
+    lazily like in the other panels.
 
-    def compose(self) -> ComposeResult:
-        with VerticalScroll(classes="scroller"):
-            yield Static(classes="editor", expand=True)
+    Hovering posts the column under the mouse too, and when a row with a span of
+    source is hovered in another panel, the span is underlined on its lines.
+    """
+
+    _code: str = ""
+    # The syntax highlighted lines, computed on first use
+    _lines: Lines | None = None
+    _numbers_width: int = 0
+    # The last line and column a HoverLine was posted for
+    _hover: tuple[int, int | None] | None = None
+    # The span underlined on the highlighted lines
+    _span: Span | None = None
 
     def set_code(self, code: str) -> None:
-        source = self.query_one(".editor", Static)
-        self._prerendered = Syntax(
+        self._code = code
+        self._lines = None
+        self._hover = None
+        self._span = None
+        self._syntax = Syntax(
             code,
             "python",
             line_numbers=True,
             word_wrap=False,
             indent_guides=True,
         )
-        source.update(self._prerendered)
+        rows = code.splitlines()
+        # Same layout as Syntax: pointer, number, space
+        self._numbers_width = len(str(len(rows))) + 2
+        width = max((len(row) for row in rows), default=0)
+        self.set_rows(rows, self._numbers_width + 1 + width)
 
-    def on_mouse_move(self, event: events.MouseMove) -> None:
-        self.post_message(HoverLine(event.y + 1))
+    def highlight_text(self, row: int) -> Text:
+        if self._lines is None:
+            style = (
+                self._background
+                + Syntax.get_theme(DEFAULT_THEME).get_style_for_token(Comment)
+                + Style(dim=True, italic=False)
+            )
+            self._lines = (
+                self._syntax.highlight(self._code)
+                .with_indent_guides(self._syntax.tab_size, style=style)
+                .split("\n", allow_blank=True)
+            )
+        text = self._lines[row]
+        span = self._span
+        if span is not None and span[0] <= row + 1 <= span[2]:
+            line = self.rows[row]
+            start = char_column(line, span[1]) if row + 1 == span[0] else 0
+            end = char_column(line, span[3]) if row + 1 == span[2] else len(line)
+            # The lines are shared with the cached rows of other states
+            text = text.copy()
+            text.stylize(HIGHLIGHT_SPAN, start, end)
+        return text
 
-    def highlight(self, line: int) -> None:
-        self.query_one(".scroller", VerticalScroll).scroll_to_region(
-            Region(0, line - 1, 0, 1)
+    def render_row(self, row: int, highlighted: bool) -> Strip:
+        # No public API for the line number styles
+        _, number_style, highlight_number_style = self._syntax._get_number_styles(
+            self.app.console
         )
-        source = self.query_one(".editor", Static)
-        self._prerendered.highlight_lines = {line}
-        self._prerendered._stylized_ranges.clear()  # type: ignore
-        self._prerendered.stylize_range(HIGHLIGHT, (line, 0), (line + 1, 0))
-        source.update(self._prerendered)
+        line_column = str(row + 1).rjust(self._numbers_width - 2) + " "
+        if highlighted:
+            gutter = [
+                Segment("❱ ", Style(color="red")),
+                Segment(line_column, highlight_number_style),
+            ]
+        else:
+            gutter = [
+                Segment("  ", highlight_number_style),
+                Segment(line_column, number_style),
+            ]
+        return Strip([*gutter, *super().render_row(row, highlighted)])
+
+    def on_mouse_move(self, event: events.MouseMove) -> None:
+        row = self.row_at(event.y)
+        column = None
+        if row < len(self.rows):
+            # Past the line numbers
+            x = event.x + self.scroll_offset.x - (self._numbers_width + 1)
+            if 0 <= x <= len(self.rows[row]):
+                column = byte_column(self.rows[row], x)
+        hover = (row + 1, column)
+        if hover != self._hover:
+            self._hover = hover
+            self.post_message(HoverLine(row + 1, column=column))
+
+    def highlight(self, line: int, span: Span | None = None) -> None:
+        """Highlight a line, or the lines of a span, underlining the span"""
+        first, last = (line, line) if span is None else (span[0], span[2])
+        if span != self._span:
+            stale = {*range(first - 1, last)}
+            if self._span is not None:
+                stale.update(range(self._span[0] - 1, self._span[2]))
+            self._span = span
+            self.restyle_rows(stale)
+        self.scroll_to_rows(first - 1, last - 1)
+        self.highlight_rows(set(range(first - 1, last)))
@@ -1,3 +1,18 @@
 from rich.style import Style
 
 HIGHLIGHT = Style(bgcolor="bright_black")
+# The span of source of the row hovered, on its highlighted lines
+HIGHLIGHT_SPAN = Style(underline=True, bold=True)
+# The rows matching the search
+MATCH = Style(bgcolor="dark_goldenrod")
+# The prefixes of the rows of a diff
+INSERTED_ROW = Style(color="green", bold=True)
+REMOVED_ROW = Style(color="red", bold=True)
+CHANGED_ROW = Style(color="yellow", bold=True)
+# The rows of the lines that ran, from least to most often
+HEAT = [
+    Style(bgcolor="#2e1a12"),
+    Style(bgcolor="#4a2215"),
+    Style(bgcolor="#662a18"),
+    Style(bgcolor="#82321b"),
+]
@@ -1,36 +1,40 @@
-import io
 import tokenize
-from token import tok_name
+from typing import Any, Iterable
 
 
-from base_widget import BaseWidget, Detail
+from base_widget import BaseWidget
+from details import (
+    Detail,
+    Span,
+    format_row,
+    format_token,
+    token_details,
+    token_text,
+)
+from incremental import IncrementalTokens
 
 
 class TokenWidget(BaseWidget):
 
+    stage = "tokens"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._incremental = IncrementalTokens(token_text, format_row)
+
     def format_token(self, token: tokenize.TokenInfo, current_line: int) -> Detail:
-        line = token.start[0]
-        end_line = token.end[0]
-        if end_line != line:
-            line_marker = f"{line:4d}-{end_line}: "
-        elif line != current_line:
-            line_marker = f"{line:4d}: "
-        else:
-            line_marker = "      "
-
-        return (
-            f"{line_marker}{tok_name[token.exact_type]:10} {token.string!r} start={token.start} end={token.end}",
-            line,
-            end_line + 1,
-        )
-
-    def set_code(self, code: str) -> None:
-        tokens = tokenize.tokenize(io.BytesIO(code.encode("utf-8")).readline)
-        details: list[Detail] = []
-        current_line = 0
-        for t in tokens:
-            d = self.format_token(t, current_line)
-            details.append(d)
-            current_line = d[1]
-
-        self.update(details)
+        return format_token(token, current_line)
+
+    def details(
+        self, code: str, spans: list[Span | None] | None = None
+    ) -> Iterable[Detail]:
+        if self.pipeline.incremental:
+            # Without spans: computing them would tokenize all the code again
+            try:
+                tree = self.pipeline.tree(code)
+            except SyntaxError:
+                pass  # The tokenizer may still get further than the parser
+            else:
+                return self._incremental.details(code, tree)
+
+        return token_details(self.pipeline, code, spans)
@@ -1,36 +1,141 @@
+from __future__ import annotations
+
 import sys
-from typing import Iterable, cast
+from bisect import bisect_right
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
 
 from textual.app import App, ComposeResult
-from textual.containers import Container, Vertical
-from textual import log, widget
+from textual.containers import Container, Horizontal, Vertical
+from textual import log, widget, work
 from textual.reactive import var
+from textual.timer import Timer
 from textual.widgets import Header, Footer, Static
+from textual.worker import get_current_worker
+from rich.text import Text
+
+from base_widget import BaseWidget
+from detail_store import DetailStore
+from details import BytecodeMode, Span
+from diff import diff_summary
 
-from bytecode_widget import BytecodeWidget
-from events import HoverLine
-from ast_widget import ASTWidget
-from token_widget import TokenWidget
+from events import HoverLine, SearchMatches
 from source_widget import SourceWidget
-from editor import EditorScreen
+from pipeline import Pipeline
+from profiling import format_measurement, profiler
+from search_index import Query
+from styles import HEAT
+
+if TYPE_CHECKING:
+    # Imported when the editor is first opened, TextArea is slow to import
+    from editor import EditorScreen, EditorTextArea
+    from bytecode_widget import BytecodeWidget
+    from runtime import RuntimeProfile
+    from search_bar import SearchBar
+    from textual.widgets import Input
 
 # This controls 3.13 features
 VERSION_3_13 = sys.version_info >= (3, 13)
 
 
-def widget_with_title(w: widget.Widget, title: str) -> Iterable[widget.Widget]:
-    with Vertical():
-        yield Static(title, classes="title")
-        yield w
+# Seconds without typing in the search bar before searching
+SEARCH_DELAY = 0.15
+
+# The pipeline stages, as shown in the status bar
+STAGE_LABELS = {
+    "tokens": "tokenize",
+    "ast": "parse",
+    "opt_ast": "optimize AST",
+    "pseudo_bc": "codegen",
+    "opt_bc": "optimize_cfg",
+    "code_obj": "assemble",
+}
+
+
+# The title of each panel, in compose order, which is also pipeline order
+PANEL_TITLES = {
+    "source": "Source (1)",
+    "tokens": "Tokens (2)",
+    "ast": "AST (3)",
+    "opt-ast": "Optimized AST (4)",
+    "pseudo-bc": "Pseudo Bytecode (5)",
+    "opt-pseudo-bc": "Optimized Pseudo Bytecode (6)",
+    "opt-code-obj": "Assembled Bytecode (7)",
+}
+if not VERSION_3_13:
+    for id in ("opt-ast", "pseudo-bc", "opt-pseudo-bc"):
+        del PANEL_TITLES[id]
+
+# The panel whose stage each panel shows the changes from, in diff mode
+DIFF_BASES = {"opt-ast": "ast", "opt-pseudo-bc": "pseudo-bc"}
+if not VERSION_3_13:
+    DIFF_BASES.clear()
+
+# The panel showing the instructions that ran, after a run
+RUNTIME_PANEL = "opt-code-obj"
+
+# How often the file watcher checks whether it was stopped, in seconds
+WATCH_TIMEOUT = 0.5
+
+
+def build_panel(id: str, pipeline: Pipeline) -> widget.Widget:
+    """
+    The widget of a panel. The modules of the stages are imported here, so
+    that those of the hidden panels are only imported once they are shown
+    """
+    if id == "source":
+        return SourceWidget(id=id)
+    if id == "tokens":
+        from token_widget import TokenWidget
+
+        return TokenWidget(id=id, pipeline=pipeline)
+    if id in ("ast", "opt-ast"):
+        from ast_widget import ASTWidget
+
+        return ASTWidget(id=id, optimized=id == "opt-ast", pipeline=pipeline)
+    from bytecode_widget import BytecodeWidget
+
+    modes: dict[str, BytecodeMode] = {
+        "pseudo-bc": "pseudo",
+        "opt-pseudo-bc": "optimized",
+    }
+    return BytecodeWidget(id=id, mode=modes.get(id, "compiled"), pipeline=pipeline)
 
 
 class CodeViewer(App[None]):
 
     TITLE = "Compiler Pipeline Explorer"
     CSS_PATH = "viewer.tcss"
-    SCREENS = {"editor": EditorScreen()}
 
     startup_code: str = ""
+    # Shared by all the panels, so that each stage is computed once per revision
+    pipeline: Pipeline
+    # The code shown in the panels
+    code: str = ""
+    # Bumped by set_code. Results computed for an older revision are thrown away
+    revision: int = 0
+    # Show an editor beside the panels, updating them as you type
+    live: bool = False
+    # In live mode, how long to wait after the last keystroke before compiling
+    debounce: float = 0.3
+    _debounce_timer: Timer | None = None
+    # Reload the code whenever this file changes
+    watch_path: Path | None = None
+    # Show the changes from the previous stage in the panels of DIFF_BASES
+    diff_stages: bool = False
+    # The last run of the code, shown until the code changes. See action_run
+    runtime: RuntimeProfile | None = None
+    _running_code: bool = False
+    # The search of the search bar, None when it is empty or closed
+    search_query: Query | None = None
+    # Only show the matching rows, rather than marking them
+    filter_matches: bool = False
+    _search_timer: Timer | None = None
+    # The source lines of the matches of each panel, by id
+    _match_lines: dict[str, list[int]]
+    # The last match gone to, by source line
+    _search_line: int | None = None
+    _search_summary: str = ""
 
     if VERSION_3_13:
         BINDINGS = [
@@ -43,6 +148,10 @@ class CodeViewer(App[None]):
             ("5", "toggle_pseudo_bc", "Pseudo BC"),
             ("6", "toggle_opt_pseudo_bc", "Opt. BC"),
             ("7", "toggle_code_obj", "Final BC"),
+            ("d", "toggle_diff", "Diff"),
+            ("r", "run", "Run"),
+            ("slash", "search", "Search"),
+            ("f", "filter", "Filter"),
         ]
     else:
         BINDINGS = [  # type: ignore
@@ -52,6 +161,9 @@ class CodeViewer(App[None]):
             ("2", "toggle_tokens", "Tokens"),
             ("3", "toggle_ast", "AST"),
             ("7", "toggle_code_obj", "Final BC"),
+            ("r", "run", "Run"),
+            ("slash", "search", "Search"),
+            ("f", "filter", "Filter"),
         ]
 
     show_source = var(True)
@@ -62,8 +174,48 @@ class CodeViewer(App[None]):
     show_opt_pseudo_bc = var(False)
     show_code_obj = var(True)
 
+    # The reactive controlling the visibility of each panel
+    PANEL_TOGGLES = {
+        "source": "show_source",
+        "tokens": "show_tokens",
+        "ast": "show_ast",
+        "opt-ast": "show_opt_ast",
+        "pseudo-bc": "show_pseudo_bc",
+        "opt-pseudo-bc": "show_opt_pseudo_bc",
+        "opt-code-obj": "show_code_obj",
+    }
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.pipeline = Pipeline()
+        self._match_lines = {}
+
+    def is_visible(self, panel: widget.Widget) -> bool:
+        return bool(getattr(self, self.PANEL_TOGGLES[panel.id or ""]))
+
     def update_visibility(self, id: str, visible: bool) -> None:
-        self.query_one(f"#{id}").parent.styles.display = "block" if visible else "none"
+        pane = self.query_one(f"#{id}-pane")
+        pane.styles.display = "block" if visible else "none"
+        if visible and not pane.query(f"#{id}"):
+            # Built the first time it is shown
+            panel = build_panel(id, self.pipeline)
+            if isinstance(panel, SourceWidget):
+                panel.set_code(self.code)
+            elif isinstance(panel, BaseWidget):
+                panel.dirty = True
+                panel.diff = self.diff_stages and id in DIFF_BASES
+                if id == RUNTIME_PANEL:
+                    cast("BytecodeWidget", panel).runtime = self.runtime
+                panel.set_search(self.search_query, self.filter_matches)
+                panel.set_heat(self.line_heat())
+            pane.mount(panel)
+        if visible:
+            panel = pane.query_one(f"#{id}")
+            if isinstance(panel, BaseWidget) and panel.dirty:
+                # Skipped by set_code while hidden, catch up now
+                panel.dirty = False
+                panel.show_message("computing…")
+                self.compute_panels(self.code, self.revision, [panel])
         visible_panels = (
             self.show_source
             + self.show_tokens
@@ -74,6 +226,9 @@ class CodeViewer(App[None]):
             + self.show_code_obj
         )
         self.query_one("#body").styles.grid_size_columns = min(visible_panels, 3)
+        if self.search_query:
+            # Matches only count in the visible panels
+            self.show_search_matches()
 
     def watch_show_source(self, show_source: bool) -> None:
         self.update_visibility("source", show_source)
@@ -100,42 +255,213 @@ class CodeViewer(App[None]):
 
     def compose(self) -> ComposeResult:
         yield Header()
-        with Container(id="body"):
-            yield from widget_with_title(SourceWidget(id="source"), "Source (1)")
-            yield from widget_with_title(TokenWidget(id="tokens"), "Tokens (2)")
-            yield from widget_with_title(ASTWidget(id="ast"), "AST (3)")
-            if VERSION_3_13:
-                yield from widget_with_title(
-                    ASTWidget(id="opt-ast", optimized=True), "Optimized AST (4)"
-                )
-                yield from widget_with_title(
-                    BytecodeWidget(id="pseudo-bc", mode="pseudo"), "Pseudo Bytecode (5)"
-                )
-                yield from widget_with_title(
-                    BytecodeWidget(id="opt-pseudo-bc", mode="optimized"),
-                    "Optimized Pseudo Bytecode (6)",
-                )
-            yield from widget_with_title(
-                BytecodeWidget(id="opt-code-obj", mode="compiled"),
-                "Assembled Bytecode (7)",
-            )
+        if self.live:
+            from editor import EditorTextArea
+
+            with Horizontal(id="split"):
+                with Vertical(id="live-pane"):
+                    yield Static("Editor", classes="title")
+                    yield EditorTextArea.code_editor(
+                        self.startup_code, language="python", id="live-editor"
+                    )
+                    yield Static(id="live-status")
+                yield from self.compose_panels()
+        else:
+            yield from self.compose_panels()
+        yield Static(id="status")
         yield Footer()
 
+    def compose_panels(self) -> ComposeResult:
+        with Container(id="body"):
+            for id, title in PANEL_TITLES.items():
+                # The panel itself is built by update_visibility once visible
+                with Vertical(id=f"{id}-pane"):
+                    # The name keeps the title, the text also shows timings
+                    yield Static(title, classes="title", id=f"{id}-title", name=title)
+
     def set_code(self, code: str) -> None:
-        cast(EditorScreen, self.SCREENS["editor"]).set_code(code)
-        source = self.query_one("#source", SourceWidget)
-        source.set_code(code)
-        self.query_one("#tokens", TokenWidget).set_code(code)
-        self.query_one("#ast", ASTWidget).set_code(code)
-        if VERSION_3_13:
-            self.query_one("#opt-ast", ASTWidget).set_code(code)
-            self.query_one("#pseudo-bc", BytecodeWidget).set_code(code)
-            self.query_one("#opt-pseudo-bc", BytecodeWidget).set_code(code)
-        self.query_one("#opt-code-obj", BytecodeWidget).set_code(code)
+        if self.live:
+            editor = self.live_editor()
+            if editor.text != code:
+                editor.text = code
+        if self.runtime is not None and self.runtime.code != code:
+            # The run was of other code
+            self.set_runtime(None)
+        for source in self.query(SourceWidget):
+            source.set_code(code)
+        self.show_heat()
+        self.code = code
+        self.compute_all()
+
+    def compute_all(self) -> None:
+        """Compute the panels for the code, throwing away older results"""
+        self.revision += 1
+        self.workers.cancel_group(self, "pipeline")
+        # In compose order, which is also pipeline order
+        panels: list[BaseWidget] = []
+        for panel in self.query(BaseWidget):
+            # Hidden panels are computed when they are shown
+            panel.dirty = not self.is_visible(panel)
+            if not panel.dirty:
+                panel.show_message("computing…")
+                panels.append(panel)
+        self.compute_panels(self.code, self.revision, panels)
+
+    @work(thread=True, group="pipeline")
+    def compute_panels(
+        self, code: str, revision: int, panels: list[BaseWidget]
+    ) -> None:
+        """Run the pipeline off the event loop, filling in each panel when ready"""
+        worker = get_current_worker()
+        for panel in panels:
+            if worker.is_cancelled or revision != self.revision:
+                return
+            try:
+                store = panel.cached_details(code)
+            except Exception as e:
+                self.call_from_thread(self.show_error, revision, panel, e)
+            else:
+                self.call_from_thread(self.show_details, revision, panel, store)
+        log(f"pipeline (hits, misses): {self.pipeline.stats()}")
+
+    def show_details(
+        self, revision: int, panel: BaseWidget, store: DetailStore
+    ) -> None:
+        if revision == self.revision:
+            panel.update(store)
+            title = self.query_one(f"#{panel.id}-title", Static)
+            parts = [title.name or ""]
+            if panel.diff:
+                base = PANEL_TITLES[DIFF_BASES[panel.id or ""]]
+                number = base.rsplit(" ", 1)[-1]
+                parts.append(f"diff from {number} {diff_summary(store)}")
+            if panel.id == RUNTIME_PANEL and self.runtime is not None:
+                parts.append("run, samples per instruction")
+            if panel.compute_time is not None:
+                parts.append(f"{panel.compute_time * 1000:.1f} ms")
+            title.update(" · ".join(parts))
+            self.update_status()
+
+    def show_error(self, revision: int, panel: BaseWidget, error: Exception) -> None:
+        if revision == self.revision:
+            panel.show_message(Text(f"{type(error).__name__}: {error}", style="red"))
+
+    def update_status(self) -> None:
+        """Show how long each stage took when last computed, and rendering"""
+        parts = [
+            f"{label} {format_measurement(profiler.last[stage])}"
+            for stage, label in STAGE_LABELS.items()
+            if stage in profiler.last
+        ]
+        if self.search_query:
+            parts.insert(0, self._search_summary)
+        if self._running_code:
+            parts.insert(0, "running…")
+        elif self.runtime is not None:
+            parts.insert(0, self.runtime.summary())
+        count, render = profiler.totals.get("render", (0, None))
+        if render is not None:
+            parts.append(f"render {count} rows {format_measurement(render)}")
+        # Also refreshed while the editor screen is on top of the panels
+        status = self.screen_stack[0].query_one("#status", Static)
+        status.update(" · ".join(parts))
 
     def on_mount(self) -> None:
+        # Reading the toggles runs their watchers, which build the visible
+        # panels. Textual would only run them after on_mount
+        for id in PANEL_TITLES:
+            getattr(self, self.PANEL_TOGGLES[id])
+        # Rendering happens as rows are scrolled into view
+        self.set_interval(1, self.update_status)
         self.set_code(self.startup_code)
-        self.query_one(".editor").focus()
+        self.query_one("#live-editor" if self.live else "#source").focus()
+        if self.watch_path is not None:
+            self.watch_file(self.watch_path, self.startup_code)
+
+    @work(thread=True, group="watch", exclusive=True)
+    def watch_file(self, path: Path, code: str) -> None:
+        """Reload the code whenever the file changes, off the event loop"""
+        # Only needed when watching
+        from watcher import FileWatcher
+
+        worker = get_current_worker()
+        with FileWatcher(path, code) as watcher:
+            while not worker.is_cancelled:
+                changed = watcher.wait(WATCH_TIMEOUT)
+                if changed is not None and not worker.is_cancelled:
+                    self.call_from_thread(self.reload_code, changed)
+
+    def reload_code(self, code: str) -> None:
+        if self.live:
+            # apply_live_code then finds the code already shown
+            self.live_editor().load_text(code)
+        if code != self.code:
+            self.set_code(code)
+
+    def on_text_area_changed(self, message: EditorTextArea.Changed) -> None:
+        if message.text_area.id != "live-editor":
+            return
+        # Restart the countdown on every keystroke
+        if self._debounce_timer is not None:
+            self._debounce_timer.stop()
+        self._debounce_timer = self.set_timer(self.debounce, self.check_live_code)
+
+    def live_editor(self) -> EditorTextArea:
+        return cast("EditorTextArea", self.query_one("#live-editor"))
+
+    def in_live_editor(self) -> bool:
+        """Whether the live editor has focus, rather than the editor screen"""
+        return (
+            self.live and self.focused is not None and self.focused.id == "live-editor"
+        )
+
+    def on_editor_text_area_save(self, message: EditorTextArea.Save) -> None:
+        if not self.in_live_editor():
+            return
+        # Don't wait for the countdown
+        if self._debounce_timer is not None:
+            self._debounce_timer.stop()
+        self.check_live_code()
+
+    def on_editor_text_area_cancel(self, message: EditorTextArea.Cancel) -> None:
+        if self.in_live_editor():
+            # Leave the live editor, so that the keybindings work again
+            self.screen.focus_next()
+
+    def check_live_code(self) -> None:
+        self.check_code(self.live_editor().text)
+
+    @work(thread=True, group="check", exclusive=True)
+    def check_code(self, code: str) -> None:
+        """Compile the live editor's code off the event loop, so typing never waits"""
+        try:
+            self.pipeline.check(code)
+        except Exception as e:
+            # Not only SyntaxError: e.g. deep nesting raises RecursionError,
+            # or MemoryError when the parser's stack overflows
+            self.call_from_thread(self.apply_live_code, code, e)
+        else:
+            self.call_from_thread(self.apply_live_code, code, None)
+
+    def apply_live_code(self, code: str, error: Exception | None) -> None:
+        if self.live_editor().text != code:
+            # Edited while it was compiling, a newer check is on its way
+            return
+        status = self.query_one("#live-status", Static)
+        if error is not None:
+            # Keep showing the last code that compiled
+            if isinstance(error, SyntaxError):
+                location = f"line {error.lineno}" if error.lineno else "unknown line"
+                if error.offset:
+                    location += f", column {error.offset}"
+                message = f"{location}: {error.msg}"
+            else:
+                message = f"{type(error).__name__}: {error}"
+            status.update(Text(message, style="red"))
+            return
+        status.update("")
+        if code != self.code:
+            self.set_code(code)
 
     def action_toggle_source(self) -> None:
         self.show_source = not self.show_source
@@ -158,30 +484,197 @@ class CodeViewer(App[None]):
     def action_toggle_code_obj(self) -> None:
         self.show_code_obj = not self.show_code_obj
 
+    def action_toggle_diff(self) -> None:
+        self.diff_stages = not self.diff_stages
+        for panel in self.query(BaseWidget):
+            panel.diff = self.diff_stages and panel.id in DIFF_BASES
+        self.compute_all()
+
+    def action_run(self) -> None:
+        if self.runtime is not None:
+            # Back to the static view
+            self.set_runtime(None)
+            self.compute_all()
+            return
+        # Only needed once run
+        from runtime import SUPPORTED
+
+        if not SUPPORTED:
+            self.notify("Running the code needs Python 3.12", severity="warning")
+            return
+        self._running_code = True
+        self.update_status()
+        self.run_code(self.code)
+
+    @work(thread=True, group="runtime", exclusive=True)
+    def run_code(self, code: str) -> None:
+        """Run the code in a separate interpreter, off the event loop"""
+        from runtime import RunError, run_profile
+
+        try:
+            profile = run_profile(code)
+        except RunError as e:
+            self.call_from_thread(self.show_run_error, e)
+        else:
+            self.call_from_thread(self.show_runtime, profile)
+
+    def show_runtime(self, profile: RuntimeProfile) -> None:
+        self._running_code = False
+        if profile.code == self.code:
+            self.set_runtime(profile)
+            self.compute_all()
+        self.update_status()
+
+    def show_run_error(self, error: Exception) -> None:
+        self._running_code = False
+        self.notify(f"Could not run: {error}", severity="error")
+        self.update_status()
+
+    def set_runtime(self, profile: RuntimeProfile | None) -> None:
+        self.runtime = profile
+        for panel in self.query(f"#{RUNTIME_PANEL}"):
+            cast("BytecodeWidget", panel).runtime = profile
+        self.show_heat()
+
+    def line_heat(self) -> dict[int, int]:
+        """The heat level of each source line that ran"""
+        if self.runtime is None:
+            return {}
+        return self.runtime.line_heat(len(HEAT))
+
+    def show_heat(self) -> None:
+        line_heat = self.line_heat()
+        for source in self.query(SourceWidget):
+            source.heat_rows({line - 1: level for line, level in line_heat.items()})
+        for panel in self.query(BaseWidget):
+            panel.set_heat(line_heat)
+
     def action_open_editor(self) -> None:
         def update_code(code: str | None) -> None:
             if code is not None:
                 self.set_code(code)
 
+        if not self.is_screen_installed("editor"):
+            # Built on first use, like the hidden panels
+            from editor import EditorScreen
+
+            screen = EditorScreen()
+            screen.pipeline = self.pipeline
+            self.install_screen(screen, "editor")
+        cast("EditorScreen", self.get_screen("editor")).set_code(self.code)
         self.push_screen("editor", update_code)
 
     def on_hover_line(self, message: HoverLine) -> None:
-        log(f"hover: {message.lineno}")
-        source = self.query_one("#source", SourceWidget)
-        source.highlight(message.lineno)
-        tokens = self.query_one("#tokens", TokenWidget)
-        tokens.highlight(message.lineno)
-        ast = self.query_one("#ast", ASTWidget)
-        ast.highlight(message.lineno)
-        if VERSION_3_13:
-            opt_ast = self.query_one("#opt-ast", ASTWidget)
-            opt_ast.highlight(message.lineno)
-            pseudo_bc = self.query_one("#pseudo-bc", BytecodeWidget)
-            pseudo_bc.highlight(message.lineno)
-            opt_pseudo_bc = self.query_one("#opt-pseudo-bc", BytecodeWidget)
-            opt_pseudo_bc.highlight(message.lineno)
-        opt_code_obj = self.query_one("#opt-code-obj", BytecodeWidget)
-        opt_code_obj.highlight(message.lineno)
+        log(f"hover: {message.lineno}:{message.column} {message.span}")
+        self.highlight_line(message.lineno, message.column, message.span)
+
+    def highlight_line(
+        self, line: int, column: int | None = None, span: Span | None = None
+    ) -> None:
+        """
+        Highlight what comes from a source line in every panel, or only from
+        the position at a column of it, or from a span of source
+        """
+        for source in self.query(SourceWidget):
+            source.highlight(line, span)
+        for panel in self.query(BaseWidget):
+            if self.is_visible(panel):
+                panel.highlight(line, column, span)
+
+    def action_search(self) -> None:
+        self.open_search_bar()
+
+    def action_filter(self) -> None:
+        self.filter_matches = not self.filter_matches
+        self.open_search_bar()
+        self.apply_search()
+
+    def search_bar(self) -> SearchBar | None:
+        bars = self.query("#search")
+        return cast("SearchBar", bars.first()) if bars else None
+
+    def open_search_bar(self) -> None:
+        bar = self.search_bar()
+        if bar is None:
+            # Built on first use, like the hidden panels
+            from search_bar import SearchBar
+
+            bar = SearchBar(id="search")
+            self.mount(bar, before="#status")
+        action = "Filter" if self.filter_matches else "Search"
+        bar.placeholder = (
+            f"{action} rows containing words, LOAD_* for a prefix"
+            " · enter: next match · escape: close"
+        )
+        bar.display = True
+        bar.focus()
+
+    def on_search_bar_closed(self, message: SearchBar.Closed) -> None:
+        bar = cast("SearchBar", self.search_bar())
+        bar.value = ""
+        bar.display = False
+        self.filter_matches = False
+        self.apply_search()
+        self.query_one("#live-editor" if self.live else "#source").focus()
+
+    def on_input_changed(self, message: Input.Changed) -> None:
+        if message.input.id != "search":
+            return
+        if self._search_timer is not None:
+            self._search_timer.stop()
+        self._search_timer = self.set_timer(SEARCH_DELAY, self.apply_search)
+
+    def apply_search(self) -> None:
+        """Search every panel for the text of the search bar"""
+        if self._search_timer is not None:
+            self._search_timer.stop()
+            self._search_timer = None
+        bar = self.search_bar()
+        query = Query(bar.value if bar is not None else "")
+        self.search_query = query if query else None
+        self._match_lines = {}
+        self._search_line = None
+        for panel in self.query(BaseWidget):
+            panel.set_search(self.search_query, self.filter_matches)
+        self.show_search_matches()
+
+    def on_search_matches(self, message: SearchMatches) -> None:
+        self._match_lines[message.panel.id or ""] = message.lines
+        self.show_search_matches()
+
+    def match_lines(self) -> list[int]:
+        """The source lines of the matches in the visible panels"""
+        lines: set[int] = set()
+        for panel in self.query(BaseWidget):
+            if self.is_visible(panel):
+                lines.update(self._match_lines.get(panel.id or "", ()))
+        return sorted(lines)
+
+    def show_search_matches(self) -> None:
+        lines = self.match_lines() if self.search_query else []
+        for source in self.query(SourceWidget):
+            source.mark_rows({line - 1 for line in lines})
+        matches = sum(
+            len(self._match_lines.get(panel.id or "", ()))
+            for panel in self.query(BaseWidget)
+            if self.is_visible(panel)
+        )
+        self._search_summary = f"search {matches} rows on {len(lines)} lines"
+        self.update_status()
+
+    def on_input_submitted(self, message: Input.Submitted) -> None:
+        if message.input.id != "search":
+            return
+        if self._search_timer is not None:
+            self.apply_search()
+            return
+        lines = self.match_lines()
+        if not lines:
+            return
+        # The next match after the last one gone to, wrapping around
+        index = bisect_right(lines, self._search_line or 0)
+        self._search_line = lines[index % len(lines)]
+        self.highlight_line(self._search_line)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+"""
+Watching the file being shown, to reload it whenever it is saved.
+
+Changes are found with inotify on Linux, called through ctypes, and by polling
+the file's modification time and size elsewhere, or when inotify can't be used.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from types import TracebackType
+
+# Once the file changed, how long it must stay unchanged before it is read, so
+# that a burst of writes, e.g. an editor saving through a temporary file, or
+# saving several times in a row, is read once
+SETTLE = 0.1
+# The longest a burst is waited for, so that a file written to without pause
+# is still reloaded
+MAX_SETTLE = 1.0
+# Seconds between two checks of the file, when polling
+POLL_INTERVAL = 0.25
+
+# From <sys/inotify.h>. The directory is watched rather than the file, which
+# editors often replace with another file when saving
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_MASK = (
+    _IN_MODIFY
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+)
+# struct inotify_event, followed by its name of len bytes
+_EVENT = struct.Struct("iIII")
+
+
+def _inotify(directory: Path) -> int | None:
+    """A non-blocking inotify descriptor watching directory, None if unavailable"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None  # Too many instances
+    if libc.inotify_add_watch(fd, os.fsencode(directory), _IN_MASK) < 0:
+        os.close(fd)  # Too many watches, or no permission
+        return None
+    return fd
+
+
+class FileWatcher:
+    """
+    Waits for the contents of a file to change.
+
+    Only contents that differ from the last ones seen are returned: saving
+    without changes, or touching the file, is ignored. While the file is
+    missing or can't be decoded, e.g. half written, it is treated as unchanged.
+    """
+
+    path: Path
+
+    def __init__(self, path: Path, text: str) -> None:
+        """text is the contents of the file already seen"""
+        self.path = path
+        self._text = text
+        self._name = os.fsencode(path.name)
+        self._fd = _inotify(path.parent.resolve())
+        self._signature = self._stat()
+
+    @property
+    def polling(self) -> bool:
+        return self._fd is None
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> FileWatcher:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def wait(self, timeout: float) -> str | None:
+        """
+        The new contents of the file, once it changed and settled, or None if it
+        didn't change in about timeout seconds.
+        """
+        if not self._changed(timeout):
+            return None
+        deadline = time.monotonic() + MAX_SETTLE
+        while self._changed(SETTLE) and time.monotonic() < deadline:
+            pass
+        try:
+            text = self.path.read_text()
+        except (OSError, UnicodeDecodeError):
+            return None
+        if text == self._text:
+            return None
+        self._text = text
+        return text
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _changed(self, timeout: float) -> bool:
+        """Whether the file changed in the next timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if self._fd is None:
+                signature = self._stat()
+                if signature != self._signature:
+                    self._signature = signature
+                    return True
+                if remaining <= 0:
+                    return False
+                time.sleep(min(POLL_INTERVAL, remaining))
+            else:
+                readable, _, _ = select.select([self._fd], [], [], max(remaining, 0))
+                if not readable:
+                    return False
+                if self._read_events():
+                    return True
+
+    def _read_events(self) -> bool:
+        """Whether the pending events include one about the file"""
+        assert self._fd is not None
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            # The queue overflowed: events may have been lost
+            if name == self._name or mask & _IN_Q_OVERFLOW:
+                return True
+        return False